@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Benchmark of pkcs7_decoder.decode_msg on large signed messages.
+
+A signed Message with SIZE_MB of encapsulated content is built from the
+signer info and certificates of test_signature.der and decoded from str,
+bytearray, memoryview and mmap inputs. The former cStringIO + StringView
+substrate is measured as well, both as a whole decode (if the installed
+pyasn1 accepts it) and as the raw cost of walking the message byte by byte.
+
+Usage: bench_decode_msg.py [SIZE_MB] [ROUNDS]
+'''
+
+import os
+import sys
+import mmap
+import tempfile
+import time
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "x509"))
+
+from pyasn1 import error
+from pkcs7 import pkcs7_decoder
+from pkcs7.der_index import read_tlv, iter_tlvs
+from pkcs7.asn1_models.decoder_workarounds import decode
+from pkcs7.asn1_models.pkcs_signed_data import Message
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_signature.der")
+CHUNK_SIZE = 64 * 1024
+
+
+class LegacyStringView(object):
+    '''
+    The substrate decode_msg used to hand to the decoder.
+    '''
+
+    def __init__(self, string, start, end):
+        self._string = string
+        self._start = start
+        if end == None:
+            self._end = len(string)
+        else:
+            self._end = end
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, key):
+        if type(key) == int:
+            if key < 0:
+                self._string.seek(self._end+key)
+                return self._string.read(1)
+            else:
+                if key >= (self._end - self._start):
+                    raise IndexError()
+                self._string.seek(self._start+key)
+                return self._string.read(1)
+        elif type(key) == slice:
+            if key.stop == None:
+                end = self._end
+            elif key.stop < 0:
+                end = self._end+key.stop
+            else:
+                end = self._start+key.stop
+            start = self._start+(key.start or 0)
+            return LegacyStringView(self._string, start=start, end=end)
+        else:
+            raise IndexError()
+
+    def __str__(self):
+        self._string.seek(self._start)
+        return self._string.read(self._end-self._start)
+
+    def __nonzero__(self):
+        return len(self)
+
+
+def _tlv(tag, content):
+    length = len(content)
+    if length < 0x80:
+        header = chr(tag) + chr(length)
+    else:
+        octets = ""
+        while length:
+            octets = chr(length & 0xff) + octets
+            length >>= 8
+        header = chr(tag) + chr(0x80 | len(octets)) + octets
+    return header + content
+
+
+def build_message(sizeMb):
+    '''
+    Returns DER of a signed Message carrying sizeMb of content, split into
+    CHUNK_SIZE chunks of a constructed OCTET STRING.
+    '''
+    sample = open(SAMPLE, "rb").read()
+    tag, content, length = read_tlv(sample, 0)
+    oid, explicit = [sample[o:c + l] for (t, o, c, l) in iter_tlvs(sample, content, content + length)]
+    tag, content, length = read_tlv(explicit, 0)
+    tag, content, length = read_tlv(explicit, content)
+    parts = [explicit[o:c + l] for (t, o, c, l) in iter_tlvs(explicit, content, content + length)]
+
+    payload = os.urandom(CHUNK_SIZE)
+    chunk = _tlv(0x04, payload)
+    chunks = chunk * int(sizeMb * 1024 * 1024 / CHUNK_SIZE)
+    dataOid = "\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x01"
+    parts[2] = _tlv(0x30, dataOid + _tlv(0xa0, _tlv(0x24, chunks)))
+    return _tlv(0x30, oid + _tlv(0xa0, _tlv(0x30, "".join(parts))))
+
+
+def _measure(func, rounds):
+    best = None
+    for _ in xrange(rounds):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _walk_bytes(substrate):
+    for idx in xrange(len(substrate)):
+        substrate[idx]
+
+
+def main():
+    sizeMb = len(sys.argv) > 1 and float(sys.argv[1]) or 4.0
+    rounds = len(sys.argv) > 2 and int(sys.argv[2]) or 3
+    message = build_message(sizeMb)
+    print "message size: %d octets, best of %d rounds" % (len(message), rounds)
+
+    fd, path = tempfile.mkstemp()
+    try:
+        os.write(fd, message)
+        mapping = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        inputs = [
+            ("str", message),
+            ("bytearray", bytearray(message)),
+            ("memoryview", memoryview(message)),
+            ("mmap", mapping),
+        ]
+        for name, data in inputs:
+            elapsed = _measure(lambda: pkcs7_decoder.decode_msg(data), rounds)
+            print "decode_msg(%s): %.3f s" % (name, elapsed)
+        mapping.close()
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+    legacyView = LegacyStringView(StringIO(message), 0, len(message))
+    try:
+        elapsed = _measure(lambda: decode(legacyView, asn1Spec=Message()), rounds)
+        print "legacy StringView decode: %.3f s" % elapsed
+    except error.PyAsn1Error, e:
+        print "legacy StringView decode: rejected by installed pyasn1 (%s)" % e
+
+    elapsed = _measure(lambda: _walk_bytes(legacyView), 1)
+    print "legacy StringView byte walk: %.3f s" % elapsed
+    elapsed = _measure(lambda: _walk_bytes(memoryview(message)), 1)
+    print "memoryview byte walk: %.3f s" % elapsed
+
+
+if __name__ == "__main__":
+    main()
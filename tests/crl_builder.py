@@ -0,0 +1,105 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Builder of synthetic DER CRLs for the tests. The CRLs are not signed (the
+signature is a placeholder), which is all crl_parse.index_crl() needs.
+'''
+
+import os
+import sys
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "x509"))
+
+import crl_parse
+
+OID_COMMON_NAME = "\x55\x04\x03"
+OID_SHA256_WITH_RSA = "\x2a\x86\x48\x86\xf7\x0d\x01\x01\x0b"
+
+THIS_UPDATE = datetime.datetime(2024, 1, 1, 0, 0, 0)
+NEXT_UPDATE = datetime.datetime(2024, 1, 8, 0, 0, 0)
+REVOKED_AT = datetime.datetime(2023, 12, 24, 12, 30, 0)
+
+
+def tlv(tag, content):
+    length = len(content)
+    if length < 0x80:
+        return chr(tag) + chr(length) + content
+    octets = "%x" % length
+    octets = ("0" * (len(octets) % 2) + octets).decode("hex")
+    return chr(tag) + chr(0x80 | len(octets)) + octets + content
+
+
+def sequence(*items):
+    return tlv(0x30, "".join(items))
+
+
+def integer(value):
+    return tlv(0x02, crl_parse.integer_content(value))
+
+
+def utc_time(date):
+    return tlv(0x17, date.strftime("%y%m%d%H%M%SZ"))
+
+
+def extension(oid, value):
+    return sequence(tlv(0x06, oid), tlv(0x04, value))
+
+
+def issuer_name(commonName="Test CA"):
+    return sequence(tlv(0x31, sequence(tlv(0x06, OID_COMMON_NAME), tlv(0x0c, commonName))))
+
+
+def revoked_entry(serial, date=REVOKED_AT, reason=None, extensions=()):
+    '''
+    Returns DER of entry of revokedCertificates. reason is encoded as the
+    only extension unless other extensions are given too.
+    '''
+    extensions = list(extensions)
+    if reason is not None:
+        reasonValue = tlv(0x0a, crl_parse.integer_content(reason))
+        extensions.insert(0, extension(crl_parse.OID_REASON_CODE, reasonValue))
+    entry = integer(serial) + utc_time(date)
+    if extensions:
+        entry += sequence(*extensions)
+    return sequence(entry)
+
+
+def build_crl(entries, crl_number=None, delta_base=None, issuer=None,
+              this_update=THIS_UPDATE, next_update=NEXT_UPDATE):
+    '''
+    Returns DER of CRL. entries are tuples (serial, date, reason) or DER of
+    the entries (see revoked_entry).
+    '''
+    if issuer is None:
+        issuer = issuer_name()
+    algorithm = sequence(tlv(0x06, OID_SHA256_WITH_RSA), tlv(0x05, ""))
+    tbs = integer(1) + algorithm + issuer + utc_time(this_update)
+    if next_update is not None:
+        tbs += utc_time(next_update)
+    if entries:
+        tbs += sequence(*[entry if isinstance(entry, str) else revoked_entry(*entry)
+                          for entry in entries])
+    extensions = []
+    if crl_number is not None:
+        extensions.append(extension(crl_parse.OID_CRL_NUMBER, integer(crl_number)))
+    if delta_base is not None:
+        extensions.append(extension(crl_parse.OID_DELTA_CRL_INDICATOR, integer(delta_base)))
+    if extensions:
+        tbs += tlv(0xa0, sequence(*extensions))
+    return sequence(sequence(tbs), algorithm, tlv(0x03, "\x00" + "\x5a" * 16))
@@ -0,0 +1,407 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Tests of crl_parse: CRL indexes, their records and lookups.
+'''
+
+import sys
+import random
+import datetime
+import unittest
+
+from pyasn1 import error
+
+from crl_builder import build_crl, revoked_entry, extension, tlv, issuer_name, \
+    REVOKED_AT, THIS_UPDATE
+import crl_parse
+from caches import LRUCache, CacheManager
+
+
+class ReasonCodeTest(unittest.TestCase):
+
+    def test_reason_only_prefix_matches_general_path(self):
+        encoded = crl_parse._REASON_ONLY_PREFIX + "\x05"
+        tag, contentOffset, length = crl_parse.read_tlv(encoded, 0)
+        self.assertEqual(contentOffset + length, len(encoded))
+        found = crl_parse._read_extensions(encoded, contentOffset, contentOffset + length,
+                                           (crl_parse.OID_REASON_CODE,))
+        valueStart, valueEnd = found[crl_parse.OID_REASON_CODE]
+        self.assertEqual(crl_parse._read_integer(encoded, valueStart, valueEnd,
+                                                 crl_parse.TAG_ENUMERATED), 5)
+
+    def test_reason_only_entries_take_fast_path(self):
+        calls = []
+        readExtensions = crl_parse._read_extensions
+
+        def counting(*args):
+            calls.append(args)
+            return readExtensions(*args)
+
+        crl_parse._read_extensions = counting
+        try:
+            index = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, serial % 11)
+                                                   for serial in xrange(1, 50)], crl_number=1))
+        finally:
+            crl_parse._read_extensions = readExtensions
+        # only the crlExtensions are walked
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(index.lookup(25).reason, 3)
+
+    def test_reason_with_other_extensions(self):
+        entry = revoked_entry(7, reason=1, extensions=[extension("\x55\x1d\x18", tlv(0x18, "20231224000000Z"))])
+        index = crl_parse.index_crl(build_crl([entry]))
+        self.assertEqual(index.lookup(7).reason, 1)
+
+    def test_out_of_range_reason_is_refused(self):
+        for reason in (11, 200, -2):
+            self.assertRaises(error.PyAsn1Error, crl_parse.index_crl,
+                              build_crl([(1, REVOKED_AT, reason)]))
+
+
+class IndexCrlTest(unittest.TestCase):
+
+    def check_index(self, index, serials):
+        self.assertEqual(len(index), len(serials))
+        self.assertEqual([entry.serial_number for entry in index], sorted(serials))
+        for serial in serials:
+            self.assertTrue(serial in index)
+            self.assertEqual(index.revocation_date(serial), REVOKED_AT)
+        for serial in (0, 3, max(serials) + 1, -1000, 1 << 200):
+            if serial not in serials:
+                self.assertFalse(serial in index)
+                self.assertEqual(index.lookup(serial), None)
+
+    def test_ordered(self):
+        serials = range(1, 300) + [1 << 70, (1 << 127) + 5]
+        index = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, 1) for serial in serials],
+                                              crl_number=12))
+        self.assertEqual(index.crl_number, 12)
+        self.assertEqual(index.delta_base, None)
+        self.assertEqual(str(index.issuer), "CN=Test CA")
+        self.assertTrue(isinstance(index.records, buffer))
+        self.check_index(index, serials)
+
+    def test_unordered_with_duplicates(self):
+        serials = [-7, 1 << 64, 2, 255, 128, 1, 65536, 127, -129]
+        entries = [(serial, REVOKED_AT, None) for serial in serials + [255, 2, -7]]
+        random.Random(1).shuffle(entries)
+        index = crl_parse.index_crl(build_crl(entries))
+        self.check_index(index, serials)
+        self.assertEqual(index.lookup(255).reason, None)
+
+    def test_empty(self):
+        index = crl_parse.index_crl(build_crl([], next_update=None))
+        self.assertEqual(len(index), 0)
+        self.assertEqual(list(index), [])
+        self.assertEqual(index.next_update, None)
+        self.assertEqual(index.lookup(1), None)
+
+    def test_remove_from_crl_ignored_in_complete_crl(self):
+        index = crl_parse.index_crl(build_crl([(1, REVOKED_AT, 1),
+                                               (2, REVOKED_AT, crl_parse.REMOVE_FROM_CRL)]))
+        self.assertEqual(len(index), 1)
+        self.assertFalse(2 in index)
+
+    def test_malformed(self):
+        der = build_crl([(1, REVOKED_AT, 1)])
+        self.assertRaises(error.PyAsn1Error, crl_parse.index_crl, der[:-20])
+        self.assertRaises(error.PyAsn1Error, crl_parse.index_crl, "\x31" + der[1:])
+
+
+class PackRecordsTest(unittest.TestCase):
+
+    keyWidth = 3
+
+    def setUp(self):
+        self.sortChunk = crl_parse._SORT_CHUNK
+
+    def tearDown(self):
+        crl_parse._SORT_CHUNK = self.sortChunk
+
+    def items(self, serials):
+        return [(crl_parse._serial_key(crl_parse.integer_content(serial), self.keyWidth),
+                 serial * 60, serial % 11) for serial in serials]
+
+    def unpack(self, records):
+        recordWidth = self.keyWidth + crl_parse.RECORD_VALUE_SIZE
+        return [(crl_parse._serial_from_key(records[offset:offset + self.keyWidth]),) +
+                crl_parse._RECORD_VALUE.unpack_from(records, offset + self.keyWidth)
+                for offset in xrange(0, len(records), recordWidth)]
+
+    def test_ordered_items(self):
+        serials = range(-300, 300)
+        records = crl_parse._pack_records(iter(self.items(serials)), len(serials), self.keyWidth)
+        self.assertEqual([record[0] for record in self.unpack(records)], serials)
+
+    def test_sort_across_chunks(self):
+        serials = range(-500, 1500)
+        shuffled = serials + serials[::7]
+        random.Random(2).shuffle(shuffled)
+        for chunk in (1, 7, 64, 1000, 65536):
+            crl_parse._SORT_CHUNK = chunk
+            records = crl_parse._pack_records(iter(self.items(shuffled)), len(shuffled),
+                                              self.keyWidth)
+            unpacked = self.unpack(records)
+            self.assertEqual([record[0] for record in unpacked], serials)
+            self.assertEqual(unpacked[10], (-490, -490 * 60, -490 % 11))
+
+    def test_sort_records_drops_duplicates(self):
+        recordWidth = self.keyWidth + crl_parse.RECORD_VALUE_SIZE
+        records = bytearray("".join(key + crl_parse._RECORD_VALUE.pack(seconds, reason)
+                                    for (key, seconds, reason) in self.items([5, 3, 5, 5, 1, 3])))
+        crl_parse._SORT_CHUNK = 2
+        result = crl_parse._sort_records(records, recordWidth, self.keyWidth)
+        self.assertEqual([record[0] for record in self.unpack(buffer(result))], [1, 3, 5])
+
+
+class LookupManyTest(unittest.TestCase):
+
+    def test_matches_lookup(self):
+        revoked = range(0, 4000, 3) + [1 << 80, -12]
+        index = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, serial % 4) for serial in revoked]))
+        rng = random.Random(3)
+        queries = [rng.randrange(-50, 4100) for i in xrange(500)] + [1 << 80, 1 << 300, 3999, 0]
+        self.assertEqual(index.lookup_many(queries), [index.lookup(serial) for serial in queries])
+        self.assertEqual(index.lookup_many([]), [])
+        self.assertEqual(index.lookup_many(sorted(queries)),
+                         [index.lookup(serial) for serial in sorted(queries)])
+
+
+def _index(entries, crl_number=None, delta_base=None, **kwargs):
+    return crl_parse.index_crl(build_crl(entries, crl_number, delta_base, **kwargs))
+
+
+LATER = REVOKED_AT + datetime.timedelta(days=3)
+
+
+class DeltaCrlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = _index([(serial, REVOKED_AT, 1) for serial in range(10, 20)], crl_number=5)
+        self.delta = _index([(12, LATER, crl_parse.REMOVE_FROM_CRL), (30, LATER, 4),
+                             (15, LATER, 3), (40, LATER, crl_parse.REMOVE_FROM_CRL)],
+                            crl_number=6, delta_base=5,
+                            this_update=THIS_UPDATE + datetime.timedelta(days=1))
+
+    def test_delta_index(self):
+        self.assertEqual(self.delta.delta_base, 5)
+        # removals are kept for with_delta(), but not shown
+        self.assertEqual(self.delta.record_count(), 4)
+        self.assertEqual(len(self.delta), 2)
+        self.assertEqual([entry.serial_number for entry in self.delta], [15, 30])
+        self.assertFalse(12 in self.delta)
+
+    def test_with_delta(self):
+        updated = self.base.with_delta(self.delta)
+        self.assertEqual(updated.crl_number, 6)
+        self.assertEqual(updated.base_crl_number, 5)
+        self.assertEqual(updated.this_update, self.delta.this_update)
+        self.assertEqual(updated.lookup(12), None)
+        self.assertFalse(12 in updated)
+        self.assertFalse(40 in updated)
+        self.assertEqual(updated.lookup(15).reason, 3)
+        self.assertEqual(updated.lookup(30).revocation_date, LATER)
+        expected = [10, 11, 13, 14, 15, 16, 17, 18, 19, 30]
+        self.assertEqual([entry.serial_number for entry in updated], expected)
+        self.assertEqual(len(updated), len(expected))
+        self.assertEqual(updated.lookup_many(range(50)), [updated.lookup(serial) for serial in range(50)])
+        # the base index is not modified
+        self.assertTrue(12 in self.base)
+        self.assertEqual(len(self.base), 10)
+
+    def test_older_delta_is_ignored(self):
+        updated = self.base.with_delta(self.delta)
+        older = _index([(11, LATER, crl_parse.REMOVE_FROM_CRL)], crl_number=6, delta_base=5)
+        self.assertTrue(updated.with_delta(older) is updated)
+        self.assertTrue(updated.with_delta(self.delta) is updated)
+
+    def test_refused_deltas(self):
+        noNumber = _index([(11, LATER, 1)], delta_base=5)
+        self.assertRaises(ValueError, self.base.with_delta, noNumber)
+        newerBase = _index([(11, LATER, 1)], crl_number=8, delta_base=7)
+        self.assertRaises(ValueError, self.base.with_delta, newerBase)
+        otherIssuer = _index([(11, LATER, 1)], crl_number=6, delta_base=5,
+                             issuer=issuer_name("Other CA"))
+        self.assertRaises(ValueError, self.base.with_delta, otherIssuer)
+        self.assertRaises(ValueError, self.base.with_delta, self.base)
+        self.assertRaises(ValueError, self.delta.with_delta, self.delta)
+        withoutNumber = _index([(11, LATER, 1)])
+        self.assertRaises(ValueError, withoutNumber.with_delta, self.delta)
+
+    def test_compacted(self):
+        updated = self.base.with_delta(self.delta)
+        compacted = updated.compacted()
+        self.assertEqual(compacted.overlay, {})
+        self.assertEqual(compacted.record_count(), len(updated))
+        self.assertEqual(list(compacted), list(updated))
+        self.assertEqual(compacted.crl_number, 6)
+        self.assertFalse(12 in compacted)
+        self.assertTrue(self.base.compacted() is self.base)
+        # serial numbers wider than the records widen the keys
+        wide = _index([(1 << 90, LATER, 1)], crl_number=7, delta_base=5)
+        widened = compacted.with_delta(wide).compacted()
+        self.assertTrue(widened.key_width > compacted.key_width)
+        self.assertEqual(widened.lookup(1 << 90).reason, 1)
+        self.assertEqual([entry.serial_number for entry in widened],
+                         [entry.serial_number for entry in compacted] + [1 << 90])
+
+
+class RevocationStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = _index([(serial, REVOKED_AT, 1) for serial in range(10, 20)], crl_number=5)
+
+    def delta(self, number, serial, reason=1):
+        return _index([(serial, LATER, reason)], crl_number=number, delta_base=5)
+
+    def test_newer_crl_replaces_older(self):
+        store = crl_parse.RevocationStore()
+        store.add(self.base)
+        newer = _index([(99, REVOKED_AT, 1)], crl_number=6)
+        store.add(newer)
+        store.add(self.base)
+        self.assertTrue(store.get(self.base.issuer) is newer)
+        self.assertTrue(store.get_by_digest(self.base.issuer.digest()) is newer)
+        self.assertRaises(ValueError, crl_parse.RevocationStore().add, self.delta(6, 1))
+
+    def test_compaction_by_overlay_size(self):
+        store = crl_parse.RevocationStore(max_overlay=2)
+        store.add(self.base)
+        store.add(self.delta(6, 30))
+        store.add(self.delta(7, 31))
+        self.assertEqual(len(store.get(self.base.issuer).overlay), 2)
+        store.add(self.delta(8, 32))
+        index = store.get(self.base.issuer)
+        self.assertEqual(index.overlay, {})
+        self.assertEqual(index.crl_number, 8)
+        self.assertEqual(len(index), 13)
+
+    def test_compaction_by_interval(self):
+        store = crl_parse.RevocationStore(compact_interval=3600)
+        store.add(self.base)
+        store.add(self.delta(6, 30))
+        self.assertEqual(len(store.get(self.base.issuer).overlay), 1)
+        self.assertEqual(store.compact(), 0)
+        # pretend the records were built long ago
+        index = store.get(self.base.issuer)
+        index.compacted_at -= 7200
+        store.add(self.delta(7, 12, crl_parse.REMOVE_FROM_CRL))
+        index = store.get(self.base.issuer)
+        self.assertEqual(index.overlay, {})
+        self.assertFalse(12 in index)
+        self.assertEqual(len(index), 10)
+
+    def test_compact(self):
+        store = crl_parse.RevocationStore()
+        store.add(self.base)
+        store.add(self.delta(6, 30))
+        self.assertEqual(store.compact(force=True), 1)
+        self.assertEqual(store.get(self.base.issuer).overlay, {})
+        self.assertEqual(store.compact(force=True), 0)
+
+    def test_size_counts_into_cache_budget(self):
+        store = crl_parse.RevocationStore()
+        store.add(self.base)
+        self.assertEqual(store.size, len(self.base.records) + sys.getsizeof({}))
+        store.add(self.delta(6, 30))
+        index = store.get(self.base.issuer)
+        self.assertTrue(index.memory_size() > len(index.records) + sys.getsizeof({}))
+        self.assertEqual(store.size, index.memory_size())
+
+        cache = LRUCache(max_entries=None)
+        manager = CacheManager(store.size + 2 * (LRUCache.ENTRY_OVERHEAD + 200))
+        manager.register("names", cache)
+        manager.track("revocations", store)
+        for number in range(10):
+            cache.put(number, "x" * 100)
+        self.assertTrue(0 < len(cache) < 10)
+        self.assertTrue(manager.size <= manager.max_bytes)
+        self.assertEqual(manager.stats()["revocations"]["size"], store.size)
+
+        # the store is never evicted from, the caches make room for it
+        other = _index([(serial, REVOKED_AT, 1) for serial in range(100)],
+                       issuer=issuer_name("Other CA"))
+        store.add(other)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(len(cache), 0)
+        store.remove(self.base.issuer)
+        self.assertEqual(store.size, other.memory_size())
+
+
+def _summary(issuer, serial):
+    return crl_parse.CertificateSummary(None, serial, issuer.digest(), None, None, None,
+                                        None, None, None, None, False, None, None, ())
+
+
+class CheckRevocationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = _index([(serial, REVOKED_AT, 1) for serial in range(10, 20)] +
+                            [(30, LATER, None)], crl_number=5)
+        self.store = crl_parse.RevocationStore()
+        self.store.add(self.index)
+        self.issuer = self.index.issuer
+        self.unknownIssuer = _index([], issuer=issuer_name("Unknown CA")).issuer
+        self.at = THIS_UPDATE + datetime.timedelta(days=1)
+
+    def check(self, serials, at=None, prefilter=None, issuer=None):
+        certs = [_summary(issuer or self.issuer, serial) for serial in serials]
+        return crl_parse.check_revocation(certs, at or self.at, self.store, prefilter)
+
+    def test_statuses(self):
+        results = self.check([12, 5, 30])
+        self.assertEqual([result.status for result in results],
+                         [crl_parse.REVOKED, crl_parse.NOT_REVOKED, crl_parse.REVOKED])
+        self.assertEqual((results[0].revocation_date, results[0].reason, results[0].stale),
+                         (REVOKED_AT, 1, False))
+        self.assertEqual(results[2].reason, None)
+        # revoked after the date checked
+        early = REVOKED_AT + datetime.timedelta(days=1)
+        self.assertEqual([result.status for result in self.check([12, 30], early)],
+                         [crl_parse.REVOKED, crl_parse.NOT_REVOKED])
+
+    def test_unknown_issuer(self):
+        certs = [_summary(self.unknownIssuer, 12), _summary(self.issuer, 12),
+                 _summary(self.unknownIssuer, 5)]
+        results = crl_parse.check_revocation(certs, self.at, self.store)
+        self.assertEqual([result.status for result in results],
+                         [crl_parse.UNKNOWN, crl_parse.REVOKED, crl_parse.UNKNOWN])
+        self.assertEqual(crl_parse.check_revocation([], self.at, self.store), [])
+
+    def test_stale_crl(self):
+        late = self.index.next_update + datetime.timedelta(seconds=1)
+        results = self.check([12, 5], late)
+        self.assertEqual([(result.status, result.stale) for result in results],
+                         [(crl_parse.REVOKED, True), (crl_parse.NOT_REVOKED, True)])
+        self.assertFalse(any(result.stale for result in self.check([12, 5])))
+
+    def test_prefilter(self):
+        from revocation_filter import RevocationFilter
+        prefilter = RevocationFilter.from_indexes(self.store)
+        serials = range(0, 40)
+        self.assertEqual(self.check(serials, prefilter=prefilter), self.check(serials))
+        self.assertEqual([result.status for result in self.check([12], prefilter=prefilter,
+                                                                 issuer=self.unknownIssuer)],
+                         [crl_parse.UNKNOWN])
+        # a delta added after the filter was built is not missed
+        self.store.add(_index([(35, REVOKED_AT, 1)], crl_number=6, delta_base=5))
+        self.assertEqual(self.check([35], prefilter=prefilter)[0].status, crl_parse.REVOKED)
+
+
+if __name__ == "__main__":
+    unittest.main()
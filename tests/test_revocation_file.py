@@ -0,0 +1,92 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Tests of revocation files: write/read round trips and invalid files.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from crl_builder import build_crl, issuer_name, REVOKED_AT
+import crl_parse
+import revocation_file
+from revocation_file import RevocationFile, RevocationFileError, write_revocation_file
+
+
+class RevocationFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "revocations")
+        self.first = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, 1) for serial in range(1, 100)],
+                                                   crl_number=5))
+        self.second = crl_parse.index_crl(build_crl([(1 << 100, REVOKED_AT, None), (-3, REVOKED_AT, 4)],
+                                                    issuer=issuer_name("Other CA"), next_update=None))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        write_revocation_file(self.path, [self.first, self.second])
+        self.assertEqual(os.listdir(self.directory), ["revocations"])
+        with RevocationFile(self.path) as revocations:
+            self.assertEqual(len(revocations), 2)
+            for original in (self.first, self.second):
+                stored = revocations.get(original.issuer)
+                self.assertTrue(stored is revocations.get_by_digest(original.issuer.digest()))
+                self.assertEqual(stored.issuer, original.issuer)
+                self.assertEqual(stored.crl_number, original.crl_number)
+                self.assertEqual(stored.this_update, original.this_update)
+                self.assertEqual(stored.next_update, original.next_update)
+                self.assertEqual(list(stored), list(original))
+            self.assertEqual(revocations.get(self.second.issuer).lookup(-3).reason, 4)
+
+    def test_indexes_with_delta_are_written_compacted(self):
+        delta = crl_parse.index_crl(build_crl([(1, REVOKED_AT, crl_parse.REMOVE_FROM_CRL),
+                                               (500, REVOKED_AT, 1)],
+                                              crl_number=6, delta_base=5))
+        updated = self.first.with_delta(delta)
+        write_revocation_file(self.path, [updated])
+        with RevocationFile(self.path) as revocations:
+            stored = revocations.get(self.first.issuer)
+            self.assertEqual(stored.overlay, {})
+            self.assertEqual(stored.crl_number, 6)
+            self.assertEqual(list(stored), list(updated))
+
+    def test_refuses_duplicate_issuers_and_deltas(self):
+        self.assertRaises(ValueError, write_revocation_file, self.path, [self.first, self.first])
+        delta = crl_parse.index_crl(build_crl([], crl_number=6, delta_base=5))
+        self.assertRaises(ValueError, write_revocation_file, self.path, [delta])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_invalid_files(self):
+        write_revocation_file(self.path, [self.first, self.second])
+        with open(self.path, "rb") as f:
+            data = f.read()
+        header = revocation_file._HEADER.size
+        for content in ("", data[:header - 1], "X" * len(data), data[:header + 10], data[:-1],
+                        data[:8] + "\x00\x63" + data[10:]):
+            with open(self.path, "wb") as f:
+                f.write(content)
+            self.assertRaises(RevocationFileError, RevocationFile, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
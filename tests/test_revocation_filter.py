@@ -0,0 +1,111 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Tests of revocation filters: membership, staleness and stored filters.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from crl_builder import build_crl, issuer_name, REVOKED_AT
+import crl_parse
+from revocation_file import RevocationFileError
+from revocation_filter import RevocationFilter, write_filter, read_filter
+
+
+class RevocationFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.first = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, 1) for serial in range(0, 3000, 2)],
+                                                   crl_number=5))
+        self.second = crl_parse.index_crl(build_crl([(-1, REVOKED_AT, None), (1 << 100, REVOKED_AT, 1)],
+                                                    issuer=issuer_name("Other CA")))
+        self.filter = RevocationFilter.from_indexes([self.first, self.second], 0.01)
+
+    def test_no_false_negatives(self):
+        self.assertEqual(self.filter.count, len(self.first) + len(self.second))
+        for index in (self.first, self.second):
+            self.assertTrue(self.filter.covers(index))
+            for entry in index:
+                self.assertTrue(self.filter.might_contain(index.issuer, entry.serial_number))
+
+    def test_false_positive_rate(self):
+        falsePositives = sum(self.filter.might_contain(self.first.issuer, serial)
+                             for serial in range(1, 20000, 2))
+        self.assertTrue(falsePositives < 10000 * 0.03)
+        self.assertTrue(self.filter.false_positive_rate() < 0.02)
+
+    def test_stale_filter(self):
+        delta = crl_parse.index_crl(build_crl([(1, REVOKED_AT, 1)], crl_number=6, delta_base=5))
+        updated = self.first.with_delta(delta)
+        self.assertFalse(self.filter.covers(updated))
+        self.assertFalse(self.filter.covers(updated.compacted()))
+        newer = crl_parse.index_crl(build_crl([], crl_number=6))
+        self.assertFalse(self.filter.covers(newer))
+        unknown = crl_parse.index_crl(build_crl([], issuer=issuer_name("Unknown CA")))
+        self.assertFalse(self.filter.covers(unknown))
+        reissued = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, 1) for serial in range(0, 3000, 2)],
+                                                 crl_number=5))
+        self.assertTrue(self.filter.covers(reissued))
+
+    def test_delta_index_is_refused(self):
+        delta = crl_parse.index_crl(build_crl([(1, REVOKED_AT, 1)], crl_number=6, delta_base=5))
+        self.assertRaises(ValueError, RevocationFilter.for_capacity(10).add_index, delta)
+
+
+class StoredFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "filter")
+        self.index = crl_parse.index_crl(build_crl([(serial, REVOKED_AT, 1) for serial in range(100)],
+                                                   crl_number=5))
+        self.filter = RevocationFilter.from_indexes([self.index])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        write_filter(self.path, self.filter)
+        self.assertEqual(os.listdir(self.directory), ["filter"])
+        stored = read_filter(self.path)
+        self.assertEqual((stored.bit_count, stored.hash_count, stored.count, stored.sources),
+                         (self.filter.bit_count, self.filter.hash_count, self.filter.count,
+                          self.filter.sources))
+        self.assertTrue(stored.covers(self.index))
+        for serial in range(200):
+            self.assertEqual(stored.might_contain(self.index.issuer, serial),
+                             self.filter.might_contain(self.index.issuer, serial))
+        self.assertRaises(TypeError, stored.add, self.index.issuer, 1000)
+        self.assertEqual(RevocationFilter.from_string(self.filter.to_string()).sources,
+                         self.filter.sources)
+
+    def test_invalid_files(self):
+        data = self.filter.to_string()
+        for content in ("", data[:10], "X" * len(data), data[:-1],
+                        data[:8] + "\x00\x01" + data[10:]):
+            with open(self.path, "wb") as f:
+                f.write(content)
+            self.assertRaises(RevocationFileError, read_filter, self.path)
+            self.assertRaises(RevocationFileError, RevocationFilter.from_string, content)
+
+
+if __name__ == "__main__":
+    unittest.main()
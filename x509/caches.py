@@ -0,0 +1,312 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Bounded caches of parsed objects.
+
+Sizes of entries are measured by estimate_size() when they are stored, plus
+ENTRY_OVERHEAD for the bookkeeping. Caches may be registered with a
+CacheManager, which keeps their total size within one byte budget.
+'''
+
+import sys
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    '''
+    Returns memory taken by value and the objects it refers to, measured by
+    sys.getsizeof: items of tuples, lists, sets and dictionaries and slots
+    of slotted models (see pkcs7_models.SlottedObject) are followed, other
+    objects are counted alone. Objects referred to more than once are
+    counted once.
+    '''
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, (tuple, list, set, frozenset)):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            stack.extend(value.iterkeys())
+            stack.extend(value.itervalues())
+        elif hasattr(type(value), "__slots__") and hasattr(value, "__getstate__"):
+            stack.extend(value.__getstate__().itervalues())
+    return size
+
+
+class LRUCache(object):
+    '''
+    Least recently used cache limited by number of entries and by measured
+    size of the entries in bytes (None means no limit).
+    Attributes:
+    - hits, misses, evictions (counters)
+    - size (size of all entries, see put)
+    - manager (CacheManager the cache is registered with, or None)
+    '''
+
+    # memory taken by one entry besides its key and value: slots of the
+    # two dictionaries of OrderedDict (hash, key, value; kept at most 2/3
+    # full), its linked list node and the (value, size) tuple
+    ENTRY_OVERHEAD = (2 * 3 * struct.calcsize("P") * 3 // 2 +
+                      sys.getsizeof([None, None, None]) + sys.getsizeof((None, 0)))
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.manager = None
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        '''
+        Stores value. Its size is measured by estimate_size() unless given;
+        the key and ENTRY_OVERHEAD are added to it. Values larger than
+        max_bytes are not stored at all.
+        '''
+        if size is None:
+            size = estimate_size(value)
+        size += estimate_size(key) + self.ENTRY_OVERHEAD
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            self._evict()
+        if self.manager is not None:
+            self.manager.enforce()
+
+    def _evict(self):
+        while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self.size > self.max_bytes)):
+            key, (value, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def evict_oldest(self):
+        '''
+        Evicts the least recently used entry. Returns False if the cache is
+        empty.
+        '''
+        with self._lock:
+            if not self._entries:
+                return False
+            key, (value, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        '''
+        Returns dictionary with counters and current usage.
+        '''
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class X509ParseCache(LRUCache):
+    '''
+    Cache of parsed certificates keyed by SHA-256 of their DER encoding and
+    the way they were parsed (lazy_extensions, fields), used through
+    x509_parse(derData, cache=...).
+    Cached certificates are never handed out; callers get copies made by
+    X509Certificate.copy(), which share the parsed data but have their own
+    verification state.
+    '''
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        LRUCache.__init__(self, max_entries, max_bytes)
+
+    @staticmethod
+    def key(derData, lazy_extensions=False, fields=None):
+        '''
+        Returns key of certificate parsed from derData with the given
+        arguments of x509_parse, so that e.g. a lazy parse is never returned
+        to a caller asking for eager one.
+        '''
+        if fields is not None:
+            fields = frozenset(fields)
+        return (hashlib.sha256(derData).digest(), bool(lazy_extensions), fields)
+
+    def get_certificate(self, key):
+        cert = self.get(key)
+        if cert is None:
+            return None
+        return cert.copy()
+
+    def put_certificate(self, key, cert):
+        self.put(key, cert.copy())
+
+
+class CacheManager(object):
+    '''
+    Keeps total size of registered caches within max_bytes.
+    When the budget is exceeded, least recently used entries are evicted
+    from the cache whose entries are the cheapest to lose: the one with the
+    lowest cost (relative cost of recomputing a byte of its entries, given
+    at registration) times hit rate. A cache that is not hit is thus
+    drained first, however expensive its entries are. The hit rate is
+    smoothed (one hit and one miss are added), so a new cache is not
+    drained before it had a chance to be hit.
+    Stores whose entries must not be evicted, like revocation indexes of
+    CRLs (crl_parse.RevocationStore), can be tracked: their size counts
+    into max_bytes, so the caches are kept smaller while they are large.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._caches = {}   # name -> (cache, cost)
+        self._stores = {}   # name -> store
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def register(self, name, cache, cost=1.0):
+        '''
+        Adds cache (LRUCache) under name. A cache can be registered with
+        one manager only.
+        '''
+        if cache.manager is not None and cache.manager is not self:
+            raise ValueError("Cache %s is already managed" % name)
+        with self._lock:
+            self._caches[name] = (cache, cost)
+        cache.manager = self
+        self.enforce()
+
+    def unregister(self, name):
+        with self._lock:
+            cache, cost = self._caches.pop(name)
+        cache.manager = None
+
+    def track(self, name, store):
+        '''
+        Adds store under name. The store must have size and manager
+        attributes and stats() like LRUCache, and call enforce() of its
+        manager when it grows.
+        '''
+        if store.manager is not None and store.manager is not self:
+            raise ValueError("Store %s is already managed" % name)
+        with self._lock:
+            self._stores[name] = store
+        store.manager = self
+        self.enforce()
+
+    def untrack(self, name):
+        with self._lock:
+            store = self._stores.pop(name)
+        store.manager = None
+
+    @property
+    def size(self):
+        return (sum(cache.size for (cache, cost) in self._caches.values()) +
+                sum(store.size for store in self._stores.values()))
+
+    def _victim(self):
+        victim = None
+        victimScore = None
+        for cache, cost in self._caches.itervalues():
+            if not len(cache):
+                continue
+            score = cost * (cache.hits + 1.0) / (cache.hits + cache.misses + 2.0)
+            if victim is None or score < victimScore:
+                victim, victimScore = cache, score
+        return victim
+
+    def enforce(self):
+        '''
+        Evicts entries until the caches and stores fit into max_bytes.
+        '''
+        with self._lock:
+            while self.size > self.max_bytes:
+                victim = self._victim()
+                if victim is None or not victim.evict_oldest():
+                    break
+                self.evictions += 1
+
+    def stats(self):
+        '''
+        Returns dictionary of statistics of the caches (see LRUCache.stats,
+        plus their cost), of the stores (cost None) and their "total"
+        (size, max_bytes and evictions made by the manager).
+        '''
+        with self._lock:
+            caches = self._caches.items()
+            stores = self._stores.items()
+        stats = {}
+        for name, (cache, cost) in caches:
+            cacheStats = cache.stats()
+            cacheStats["cost"] = cost
+            stats[name] = cacheStats
+        for name, store in stores:
+            storeStats = store.stats()
+            storeStats["cost"] = None
+            stats[name] = storeStats
+        stats["total"] = {
+            "size": sum(cacheStats["size"] for cacheStats in stats.values()),
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+        return stats
@@ -0,0 +1,896 @@
+#!/usr/bin/python
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Streaming reader of CRLs building compact revocation indexes.
+
+The CRL is walked TLV by TLV (see pkcs7.der_index), straight from a
+memory-mapped file, so even CRLs of hundreds of MB are read without
+building pyasn1 objects for the revoked certificates; only the issuer is
+decoded. The result is a RevocationIndex: fixed-width records sorted by
+serial number in one buffer, searched by bisection.
+
+Revoked certificates are looked up by X509Certificate.get_revocation_date()
+in revocation_store, where indexes are added by RevocationStore.add().
+'''
+
+import sys
+import mmap
+import base64
+import struct
+import calendar
+import time
+import heapq
+import datetime
+import threading
+from collections import namedtuple
+
+from pyasn1 import error
+
+from pkcs7.der_index import read_tlv, iter_tlvs, TAG_INTEGER, TAG_SEQUENCE
+from pkcs7.asn1_models.general_types import Name as Asn1Name
+from pkcs7.asn1_models.decoder_workarounds import decode, as_substrate
+from pkcs7_models import Name, CertificateSummary
+from parse_session import current_session
+from caches import estimate_size
+
+TAG_OCTET_STRING = 0x04
+TAG_OID = 0x06
+TAG_ENUMERATED = 0x0a
+TAG_UTC_TIME = 0x17
+TAG_GENERALIZED_TIME = 0x18
+TAG_CRL_EXTENSIONS = 0xa0       # [0] EXPLICIT Extensions
+
+# DER content octets of OIDs of the extensions we read
+OID_CRL_NUMBER = "\x55\x1d\x14"         # 2.5.29.20
+OID_REASON_CODE = "\x55\x1d\x15"        # 2.5.29.21
+OID_DELTA_CRL_INDICATOR = "\x55\x1d\x1b"     # 2.5.29.27
+
+NO_REASON = -1
+# CRLReason of delta CRL entries of certificates no longer revoked
+REMOVE_FROM_CRL = 8
+# highest CRLReason code (aACompromise)
+MAX_REASON = 10
+
+# revocation date (seconds since the epoch, UTC) and reason code
+_RECORD_VALUE = struct.Struct(">qb")
+RECORD_VALUE_SIZE = _RECORD_VALUE.size
+
+# One revoked certificate. revocation_date is datetime (UTC), reason the
+# CRLReason code or None if not given.
+RevokedEntry = namedtuple("RevokedEntry", "serial_number revocation_date reason")
+
+
+def _time_to_epoch(data, tag, contentOffset, length):
+    '''
+    Converts UTCTime or GeneralizedTime (YYYYMMDDHHMMSS[Z]) to seconds
+    since the epoch.
+    '''
+    value = data[contentOffset:contentOffset + length]
+    if tag == TAG_UTC_TIME:
+        year = int(value[:2])
+        year += 1900 if year >= 50 else 2000
+        value = value[2:]
+    elif tag == TAG_GENERALIZED_TIME:
+        year = int(value[:4])
+        value = value[4:]
+    else:
+        raise error.PyAsn1Error('Unexpected tag 0x%02x of time at offset %d' % (tag, contentOffset))
+    try:
+        second = int(value[8:10])
+    except ValueError:
+        second = 0
+    return calendar.timegm((year, int(value[0:2]), int(value[2:4]),
+                            int(value[4:6]), int(value[6:8]), second))
+
+
+def epoch_to_datetime(seconds):
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=seconds)
+
+
+def _datetime_to_epoch(date):
+    return calendar.timegm(date.utctimetuple())
+
+
+def _serial_key(content, width):
+    '''
+    Returns sort key of serial number given by its INTEGER content octets:
+    sign octet followed by the two's complement padded to width - 1 octets.
+    '''
+    if content and ord(content[0]) & 0x80:
+        return "\x00" + content.rjust(width - 1, "\xff")
+    content = content.lstrip("\x00")
+    return "\x01" + content.rjust(width - 1, "\x00")
+
+
+def integer_content(serial):
+    '''
+    Returns INTEGER content octets of serial number (or other integer),
+    without redundant leading octets.
+    '''
+    if serial >= 0:
+        hexValue = "%x" % serial
+        if len(hexValue) % 2:
+            hexValue = "0" + hexValue
+        content = hexValue.decode("hex")
+        if not content or ord(content[0]) & 0x80:
+            content = "\x00" + content
+        return content
+    length = 1
+    while -serial > 1 << (8 * length - 1):
+        length += 1
+    hexValue = "%x" % ((1 << (8 * length)) + serial)
+    return hexValue.rjust(2 * length, "0").decode("hex")
+
+
+def _serial_from_key(key):
+    if key[0] == "\x00":
+        magnitude = long(key[1:].encode("hex"), 16)
+        return magnitude - (1 << (8 * (len(key) - 1)))
+    return long(key[1:].encode("hex") or "0", 16)
+
+
+def _read_extensions(data, offset, end, wanted):
+    '''
+    Walks Extensions in data[offset:end]. Returns dictionary of content
+    octets of OIDs in wanted to (offset, end) of the extnValue contents.
+    '''
+    found = {}
+    for tag, extOffset, extContent, extLength in iter_tlvs(data, offset, end):
+        fields = list(iter_tlvs(data, extContent, extContent + extLength))
+        if not fields or fields[0][0] != TAG_OID:
+            raise error.PyAsn1Error('Malformed extension at offset %d' % extOffset)
+        oidTag, oidOffset, oidContent, oidLength = fields[0]
+        oid = data[oidContent:oidContent + oidLength]
+        if oid in wanted:
+            valueTag, valueOffset, valueContent, valueLength = fields[-1]
+            if valueTag != TAG_OCTET_STRING:
+                raise error.PyAsn1Error('Malformed extension at offset %d' % extOffset)
+            found[oid] = (valueContent, valueContent + valueLength)
+    return found
+
+
+def _read_integer(data, offset, end, expectedTag=TAG_INTEGER):
+    tag, contentOffset, length = read_tlv(data, offset, end)
+    if tag != expectedTag:
+        raise error.PyAsn1Error('Unexpected tag 0x%02x at offset %d' % (tag, offset))
+    return integer_from_content(data[contentOffset:contentOffset + length])
+
+
+def integer_from_content(content):
+    '''
+    Returns value of INTEGER given by its content octets.
+    '''
+    value = long(content.encode("hex") or "0", 16)
+    if content and ord(content[0]) & 0x80:
+        value -= 1 << (8 * len(content))
+    return value
+
+
+class RevocationIndex(object):
+    '''
+    Revoked certificates of one CRL, possibly updated by delta CRLs.
+    Attributes:
+    - issuer (pkcs7_models.Name)
+    - this_update, next_update (datetime, UTC; next_update may be None)
+    - crl_number (None if the CRL has no CRL number extension)
+    - delta_base (number of the base CRL if this is a delta CRL, else None)
+    - base_crl_number (CRL number of the records, see below)
+    - issuer_der (DER encoding of the issuer)
+    - records (buffer of a bytearray, or of a revocation file): the
+      entries, each of them record_width octets long: serial number key of
+      key_width octets (see _serial_key), revocation date and reason.
+      Records are sorted by the key, so lookup is a bisection.
+    - overlay (dictionary of RevokedEntries by serial number applied from
+      delta CRLs; they take precedence over the records, entries with
+      reason REMOVE_FROM_CRL mark certificates no longer revoked)
+    Entries with reason REMOVE_FROM_CRL are kept in the records of delta
+    CRLs only; lookups, iteration and len() never show them, and
+    compacted() drops them together with the entries they remove.
+    - compacted_at (time.time() when the records were built)
+    Indexes are never modified; with_delta() and compacted() return new
+    ones, so indexes can be replaced while other threads use them.
+    '''
+
+    def __init__(self, issuer, this_update, next_update, crl_number,
+                 records, key_width, issuer_der=None, delta_base=None,
+                 overlay=None, base_crl_number=None, compacted_at=None):
+        self.issuer = issuer
+        self.this_update = this_update
+        self.next_update = next_update
+        self.crl_number = crl_number
+        self.delta_base = delta_base
+        self.issuer_der = issuer_der
+        self.records = records
+        self.key_width = key_width
+        self.record_width = key_width + _RECORD_VALUE.size
+        self._recordCount = len(records) // self.record_width
+        if overlay is None:
+            overlay = {}
+        self.overlay = overlay
+        if base_crl_number is None:
+            base_crl_number = crl_number
+        self.base_crl_number = base_crl_number
+        if compacted_at is None:
+            compacted_at = time.time()
+        self.compacted_at = compacted_at
+        self._memorySize = None
+
+    def record_count(self):
+        return self._recordCount
+
+    def memory_size(self):
+        '''
+        Returns memory taken by the index: length of the records plus the
+        measured size of the overlay (see caches.estimate_size).
+        '''
+        if self._memorySize is None:
+            self._memorySize = len(self.records) + estimate_size(self.overlay)
+        return self._memorySize
+
+    def __len__(self):
+        count = self.record_count()
+        if self.delta_base is not None:
+            count -= sum(1 for entry in self._iter_records() if entry.reason == REMOVE_FROM_CRL)
+        for serial, entry in self.overlay.iteritems():
+            count -= self._find(serial) >= 0
+            count += entry.reason != REMOVE_FROM_CRL
+        return count
+
+    def _key(self, position):
+        start = position * self.record_width
+        return self.records[start:start + self.key_width]
+
+    def _search_key(self, serial):
+        '''
+        Returns key of serial number in the records, None if it does not
+        fit into key_width (then it is not in the records).
+        '''
+        content = integer_content(serial)
+        if len(content) >= self.key_width:
+            content = content.lstrip("\x00")
+            if len(content) >= self.key_width:
+                return None
+        return _serial_key(content, self.key_width)
+
+    def _bisect(self, key, low=0, high=None):
+        '''
+        Returns position of the first record with key not less than key,
+        searching positions from low to high.
+        '''
+        if high is None:
+            high = self._recordCount
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, serial):
+        '''
+        Returns position of record of serial number or -1.
+        '''
+        key = self._search_key(serial)
+        if key is None:
+            return -1
+        position = self._bisect(key)
+        if position < self._recordCount and self._key(position) == key:
+            return position
+        return -1
+
+    def _entry(self, position):
+        start = position * self.record_width
+        key = self.records[start:start + self.key_width]
+        seconds, reason = _RECORD_VALUE.unpack_from(self.records, start + self.key_width)
+        if reason == NO_REASON:
+            reason = None
+        return RevokedEntry(_serial_from_key(key), epoch_to_datetime(seconds), reason)
+
+    def lookup(self, serial):
+        '''
+        Returns RevokedEntry of certificate with given serial number or
+        None if it is not revoked by this CRL.
+        '''
+        entry = self.overlay.get(serial)
+        if entry is None:
+            position = self._find(serial)
+            if position < 0:
+                return None
+            entry = self._entry(position)
+        if entry.reason == REMOVE_FROM_CRL:
+            return None
+        return entry
+
+    def lookup_many(self, serials):
+        '''
+        Returns list of lookup() results of serial numbers (a sequence).
+        The records are searched in the order of the keys, every search
+        galloping from where the previous one ended, so looking up m serial
+        numbers takes O(m log(n / m)) instead of O(m log n) comparisons.
+        '''
+        results = [None] * len(serials)
+        overlay = self.overlay
+        pending = []
+        for position, serial in enumerate(serials):
+            entry = overlay.get(serial)
+            if entry is not None:
+                if entry.reason != REMOVE_FROM_CRL:
+                    results[position] = entry
+                continue
+            key = self._search_key(serial)
+            if key is not None:
+                pending.append((key, position))
+        pending.sort()
+        low = 0
+        recordCount = self._recordCount
+        for key, position in pending:
+            # find range of the key by doubling the step, then bisect it
+            step = 1
+            high = low
+            while high < recordCount and self._key(high) < key:
+                low = high + 1
+                high += step
+                step *= 2
+            low = self._bisect(key, low, min(high, recordCount))
+            if low == recordCount:
+                break
+            if self._key(low) == key:
+                entry = self._entry(low)
+                if entry.reason != REMOVE_FROM_CRL:
+                    results[position] = entry
+        return results
+
+    def revocation_date(self, serial):
+        entry = self.lookup(serial)
+        if entry is None:
+            return None
+        return entry.revocation_date
+
+    def __contains__(self, serial):
+        entry = self.overlay.get(serial)
+        if entry is not None:
+            return entry.reason != REMOVE_FROM_CRL
+        position = self._find(serial)
+        if position < 0:
+            return False
+        reasonOffset = position * self.record_width + self.record_width - 1
+        return self.records[reasonOffset] != chr(REMOVE_FROM_CRL)
+
+    def _iter_records(self):
+        '''
+        Yields RevokedEntries of all records (including those with reason
+        REMOVE_FROM_CRL), ignoring the overlay.
+        '''
+        return (self._entry(position) for position in xrange(self._recordCount))
+
+    def __iter__(self):
+        '''
+        Yields RevokedEntries of revoked certificates ordered by serial
+        number (the records updated by the overlay, without entries with
+        reason REMOVE_FROM_CRL).
+        '''
+        overlay = self.overlay
+        base = self._iter_records()
+        if self.delta_base is not None:
+            base = (entry for entry in base if entry.reason != REMOVE_FROM_CRL)
+        if overlay:
+            base = (entry for entry in base if entry.serial_number not in overlay)
+            added = sorted(entry for entry in overlay.itervalues()
+                           if entry.reason != REMOVE_FROM_CRL)
+            base = heapq.merge(base, added)
+        return base
+
+    def with_delta(self, delta):
+        '''
+        Returns index updated by delta CRL (RevocationIndex of it). Entries
+        of the delta replace those of the index, entries with reason
+        REMOVE_FROM_CRL remove them. Delta not newer than the index (by CRL
+        number) is ignored, the index itself is returned then.
+        Raises ValueError if the delta is not applicable: it has no CRL
+        number (it could not be ordered), its issuer differs or the base CRL
+        of the index is older than the delta requires.
+        '''
+        if delta.delta_base is None:
+            raise ValueError("CRL %s of %s is not a delta CRL" % (delta.crl_number, delta.issuer))
+        if delta.crl_number is None:
+            raise ValueError("Delta CRL of %s has no CRL number" % delta.issuer)
+        if self.delta_base is not None:
+            raise ValueError("Delta CRL can not be applied to a delta CRL")
+        if delta.issuer != self.issuer:
+            raise ValueError("Delta CRL of %s can not be applied to CRL of %s" % (delta.issuer, self.issuer))
+        if self.base_crl_number is None or self.base_crl_number < delta.delta_base:
+            raise ValueError("Delta CRL %s of %s requires base CRL %s, index has %s" % (
+                delta.crl_number, delta.issuer, delta.delta_base, self.base_crl_number))
+        if self.crl_number is not None and delta.crl_number <= self.crl_number:
+            return self
+        overlay = dict(self.overlay)
+        for entry in delta._iter_records():
+            overlay[entry.serial_number] = entry
+        return RevocationIndex(self.issuer, delta.this_update, delta.next_update,
+                               delta.crl_number, self.records, self.key_width,
+                               self.issuer_der, None, overlay,
+                               self.base_crl_number, self.compacted_at)
+
+    def compacted(self):
+        '''
+        Returns index with the overlay merged into the records; entries
+        removed by delta CRLs are dropped.
+        '''
+        if not self.overlay:
+            return self
+        keyWidth = self.key_width
+        for serial in self.overlay:
+            keyWidth = max(keyWidth, len(integer_content(serial)) + 1)
+        items = ((_serial_key(integer_content(entry.serial_number), keyWidth),
+                  _datetime_to_epoch(entry.revocation_date),
+                  NO_REASON if entry.reason is None else entry.reason)
+                 for entry in self)
+        return RevocationIndex(self.issuer, self.this_update, self.next_update,
+                               self.crl_number, _pack_records(items, len(self), keyWidth),
+                               keyWidth, self.issuer_der, self.delta_base)
+
+
+# entry extensions holding just the reason code, the usual case, up to the
+# ENUMERATED value octet: Extensions SEQUENCE, Extension SEQUENCE, OID,
+# OCTET STRING, ENUMERATED
+_REASON_ONLY_PREFIX = "\x30\x0c\x30\x0a\x06\x03" + OID_REASON_CODE + "\x04\x03\x0a\x01"
+
+
+def _reason_error(reason, entryOffset):
+    return error.PyAsn1Error('Reason code %d of revoked certificate at offset %d is out of range'
+                             % (reason, entryOffset))
+
+
+def _iter_revoked(data, offset, end):
+    '''
+    Yields tuples (serial number content octets, revocation date in seconds
+    since the epoch, reason code) of revokedCertificates in data[offset:end].
+    Raises PyAsn1Error if a reason code is out of range.
+    '''
+    times = {}
+    for tag, entryOffset, entryContent, entryLength in iter_tlvs(data, offset, end):
+        entryEnd = entryContent + entryLength
+        serialTag, serialContent, serialLength = read_tlv(data, entryContent, entryEnd)
+        if tag != TAG_SEQUENCE or serialTag != TAG_INTEGER:
+            raise error.PyAsn1Error('Malformed revoked certificate at offset %d' % entryOffset)
+        timeOffset = serialContent + serialLength
+        timeTag, timeContent, timeLength = read_tlv(data, timeOffset, entryEnd)
+        extsOffset = timeContent + timeLength
+        # revocation dates repeat a lot (revoked in batches)
+        timeKey = data[timeOffset:extsOffset]
+        seconds = times.get(timeKey)
+        if seconds is None:
+            if len(times) >= 4096:
+                times.clear()
+            seconds = times[timeKey] = _time_to_epoch(data, timeTag, timeContent, timeLength)
+        reason = NO_REASON
+        if extsOffset == entryEnd:
+            pass
+        elif entryEnd - extsOffset == len(_REASON_ONLY_PREFIX) + 1 and \
+                data[extsOffset:entryEnd - 1] == _REASON_ONLY_PREFIX:
+            reason = ord(data[entryEnd - 1])
+            if reason > MAX_REASON:
+                raise _reason_error(reason, entryOffset)
+        else:
+            extsTag, extsContent, extsLength = read_tlv(data, extsOffset, entryEnd)
+            found = _read_extensions(data, extsContent, extsContent + extsLength,
+                                     (OID_REASON_CODE,))
+            if OID_REASON_CODE in found:
+                valueStart, valueEnd = found[OID_REASON_CODE]
+                reason = _read_integer(data, valueStart, valueEnd, TAG_ENUMERATED)
+                if not 0 <= reason <= MAX_REASON:
+                    raise _reason_error(reason, entryOffset)
+        yield data[serialContent:serialContent + serialLength], seconds, reason
+
+
+def _scan_revoked(data, offset, end):
+    '''
+    Returns tuple (length of the longest serial number, number of entries)
+    of revokedCertificates in data[offset:end].
+    '''
+    maxLength = 0
+    count = 0
+    while offset < end:
+        tag, entryContent, entryLength = read_tlv(data, offset, end)
+        serialTag, serialContent, serialLength = read_tlv(data, entryContent, entryContent + entryLength)
+        if serialLength > maxLength:
+            maxLength = serialLength
+        offset = entryContent + entryLength
+        count += 1
+    return maxLength, count
+
+
+def _pack_records(items, count, keyWidth):
+    '''
+    Returns records (buffer) of items, tuples (key, revocation date in
+    seconds since the epoch, reason code), at most count of them. Records
+    are written to one preallocated bytearray and sorted there unless the
+    items come ordered by key already, as they usually do.
+    '''
+    recordWidth = keyWidth + _RECORD_VALUE.size
+    records = bytearray(count * recordWidth)
+    packInto = _RECORD_VALUE.pack_into
+    ordered = True
+    lastKey = None
+    offset = 0
+    for key, seconds, reason in items:
+        if lastKey is not None and key <= lastKey:
+            ordered = False
+        lastKey = key
+        records[offset:offset + keyWidth] = key
+        packInto(records, offset + keyWidth, seconds, reason)
+        offset += recordWidth
+    del records[offset:]
+    if not ordered:
+        records = _sort_records(records, recordWidth, keyWidth)
+    return buffer(records)
+
+
+# number of records sorted in memory at once by _sort_records()
+_SORT_CHUNK = 65536
+
+
+def _sort_records(records, recordWidth, keyWidth):
+    '''
+    Sorts bytearray of fixed-width records and drops records with the same
+    key as the previous one. Chunks of _SORT_CHUNK records are sorted in
+    place, then merged into a new bytearray, which is returned; only one
+    chunk at a time is split into separate strings.
+    '''
+    chunkLength = _SORT_CHUNK * recordWidth
+    chunks = []
+    for start in xrange(0, len(records), chunkLength):
+        end = min(start + chunkLength, len(records))
+        chunk = str(records[start:end])
+        sortedChunk = [chunk[i:i + recordWidth] for i in xrange(0, len(chunk), recordWidth)]
+        sortedChunk.sort()
+        records[start:end] = "".join(sortedChunk)
+        chunks.append((start, end))
+    del chunk, sortedChunk
+
+    view = buffer(records)
+
+    def iter_chunk(start, end):
+        for offset in xrange(start, end, recordWidth):
+            yield view[offset:offset + recordWidth]
+
+    result = bytearray(len(records))
+    offset = 0
+    lastKey = None
+    for record in heapq.merge(*[iter_chunk(start, end) for (start, end) in chunks]):
+        key = record[:keyWidth]
+        if key != lastKey:
+            result[offset:offset + recordWidth] = record
+            offset += recordWidth
+            lastKey = key
+    del result[offset:]
+    return result
+
+
+def index_crl(data):
+    '''
+    Builds RevocationIndex of DER encoded CRL. data may be str or mmap (or
+    anything else supporting len(), indexing and slicing).
+    Raises PyAsn1Error if the CRL is malformed.
+    '''
+    tag, listContent, listLength = read_tlv(data, 0)
+    if tag != TAG_SEQUENCE:
+        raise error.PyAsn1Error('CRL is not a SEQUENCE')
+    tag, tbsContent, tbsLength = read_tlv(data, listContent, listContent + listLength)
+    if tag != TAG_SEQUENCE:
+        raise error.PyAsn1Error('tbsCertList is not a SEQUENCE')
+    tlvs = iter_tlvs(data, tbsContent, tbsContent + tbsLength)
+
+    # version, signature
+    tag, offset, contentOffset, length = tlvs.next()
+    if tag == TAG_INTEGER:
+        tag, offset, contentOffset, length = tlvs.next()
+    # issuer
+    tag, offset, contentOffset, length = tlvs.next()
+    issuerDer = as_substrate(data[offset:contentOffset + length])
+    issuer = decode_issuer(issuerDer)
+    # thisUpdate, nextUpdate
+    tag, offset, contentOffset, length = tlvs.next()
+    thisUpdate = epoch_to_datetime(_time_to_epoch(data, tag, contentOffset, length))
+    nextUpdate = None
+    revoked = None
+    crlNumber = None
+    deltaBase = None
+    for tag, offset, contentOffset, length in tlvs:
+        if tag in (TAG_UTC_TIME, TAG_GENERALIZED_TIME):
+            nextUpdate = epoch_to_datetime(_time_to_epoch(data, tag, contentOffset, length))
+        elif tag == TAG_SEQUENCE:
+            revoked = (contentOffset, contentOffset + length)
+        elif tag == TAG_CRL_EXTENSIONS:
+            extsTag, extsContent, extsLength = read_tlv(data, contentOffset, contentOffset + length)
+            found = _read_extensions(data, extsContent, extsContent + extsLength,
+                                     (OID_CRL_NUMBER, OID_DELTA_CRL_INDICATOR))
+            if OID_CRL_NUMBER in found:
+                crlNumber = _read_integer(data, *found[OID_CRL_NUMBER])
+            if OID_DELTA_CRL_INDICATOR in found:
+                deltaBase = _read_integer(data, *found[OID_DELTA_CRL_INDICATOR])
+
+    records = buffer("")
+    keyWidth = 1
+    if revoked is not None:
+        # first pass finds the width of serial number keys and the number
+        # of records
+        maxLength, count = _scan_revoked(data, *revoked)
+        keyWidth = maxLength + 1
+        items = ((_serial_key(serial, keyWidth), seconds, reason)
+                 for (serial, seconds, reason) in _iter_revoked(data, *revoked))
+        if deltaBase is None:
+            # removeFromCRL is only meaningful in delta CRLs
+            items = (item for item in items if item[2] != REMOVE_FROM_CRL)
+        records = _pack_records(items, count, keyWidth)
+    return RevocationIndex(issuer, thisUpdate, nextUpdate, crlNumber,
+                           records, keyWidth, issuerDer, deltaBase)
+
+
+def decode_issuer(derData):
+    '''
+    Returns pkcs7_models.Name of DER encoded Name.
+    '''
+    return Name.from_asn1(decode(derData, asn1Spec=current_session().templates.get(Asn1Name))[0])
+
+
+def read_crl(crl):
+    '''
+    Builds RevocationIndex of CRL file (DER, or PEM which is decoded to
+    memory first).
+    @param crl: file name or file object opened for reading
+    '''
+    if hasattr(crl, "fileno"):
+        f = crl
+    else:
+        f = open(crl, "rb")
+    try:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mapping[:11] == "-----BEGIN ":
+                bodyStart = mapping.find("\n") + 1
+                bodyEnd = mapping.find("-----END ", bodyStart)
+                return index_crl(base64.b64decode(mapping[bodyStart:bodyEnd]))
+            return index_crl(mapping)
+        finally:
+            mapping.close()
+    finally:
+        if f is not crl:
+            f.close()
+
+
+class RevocationStore(object):
+    '''
+    Revocation indexes by issuer (pkcs7_models.Name).
+    Delta CRLs added are applied to the index of their issuer. The index
+    is compacted (see RevocationIndex.compacted) when a delta is applied
+    to it and its overlay has more than max_overlay entries or it was last
+    compacted more than compact_interval seconds ago, so deltas fetched
+    periodically are merged at most every compact_interval seconds.
+    compact() compacts indexes due regardless of new deltas.
+    Attributes:
+    - size (sum of RevocationIndex.memory_size() of the indexes)
+    - manager (caches.CacheManager tracking the store, or None; indexes
+      are never evicted, but their size counts into the budget of the
+      manager's caches, see CacheManager.track)
+    '''
+
+    def __init__(self, compact_interval=3600, max_overlay=65536):
+        self.compact_interval = compact_interval
+        self.max_overlay = max_overlay
+        self._indexes = {}
+        self._issuers = {}      # Name.digest() -> Name
+        self._lock = threading.Lock()
+        self.size = 0
+        self.manager = None
+
+    def _set(self, issuer, index):
+        '''
+        Replaces index of issuer (None removes it). Called with the lock held.
+        '''
+        current = self._indexes.pop(issuer, None)
+        if current is not None:
+            self.size -= current.memory_size()
+        if index is not None:
+            self._indexes[issuer] = index
+            self.size += index.memory_size()
+
+    def _enforce(self):
+        manager = self.manager
+        if manager is not None:
+            manager.enforce()
+
+    def add(self, index):
+        '''
+        Adds RevocationIndex of a CRL. It replaces index of the same issuer
+        unless that one is newer (by CRL number, or thisUpdate). Index of a
+        delta CRL is applied to the index of its issuer instead.
+        Raises ValueError if the delta CRL can not be applied.
+        '''
+        with self._lock:
+            current = self._indexes.get(index.issuer)
+            if index.delta_base is not None:
+                if current is None:
+                    raise ValueError("No base CRL of %s for delta CRL %s" % (index.issuer, index.crl_number))
+                index = current.with_delta(index)
+                if index is not current and self._compaction_due(index, time.time()):
+                    index = index.compacted()
+                self._set(index.issuer, index)
+            elif current is None or _crl_order(index) >= _crl_order(current):
+                self._set(index.issuer, index)
+                self._issuers[index.issuer.digest()] = index.issuer
+        self._enforce()
+
+    def get(self, issuer):
+        return self._indexes.get(issuer)
+
+    def get_by_digest(self, issuer_digest):
+        '''
+        Returns index of issuer given by its Name.digest() or None.
+        '''
+        issuer = self._issuers.get(issuer_digest)
+        if issuer is None:
+            return None
+        return self._indexes.get(issuer)
+
+    def remove(self, issuer):
+        with self._lock:
+            self._set(issuer, None)
+            self._issuers.pop(issuer.digest(), None)
+
+    def issuers(self):
+        return self._indexes.keys()
+
+    def __iter__(self):
+        return iter(self._indexes.values())
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def stats(self):
+        '''
+        Returns dictionary with number of indexes ("entries") and "size".
+        '''
+        return {"entries": len(self._indexes), "size": self.size}
+
+    def _compaction_due(self, index, now):
+        return index.overlay and (len(index.overlay) > self.max_overlay or
+                                  index.compacted_at <= now - self.compact_interval)
+
+    def compact(self, force=False):
+        '''
+        Compacts indexes with overlay that are due (see above; all indexes
+        with overlay if force). Returns number of indexes compacted.
+        '''
+        now = time.time()
+        with self._lock:
+            candidates = [index for index in self._indexes.itervalues()
+                          if index.overlay and (force or self._compaction_due(index, now))]
+        compacted = 0
+        for index in candidates:
+            # merging is done outside of the lock, the index is replaced only
+            # if no delta was applied meanwhile
+            result = index.compacted()
+            with self._lock:
+                if self._indexes.get(index.issuer) is index:
+                    self._set(index.issuer, result)
+                    compacted += 1
+        return compacted
+
+
+def _crl_order(index):
+    return (index.crl_number, index.this_update)
+
+
+# store used by X509Certificate.get_revocation_date() and check_revocation()
+revocation_store = RevocationStore()
+
+
+# statuses of check_revocation()
+NOT_REVOKED = "not revoked"
+REVOKED = "revoked"
+UNKNOWN = "unknown"         # no CRL of the issuer is known
+
+# Revocation status of a certificate. revocation_date and reason are set for
+# REVOKED certificates. stale is True if nextUpdate of the CRL has passed.
+RevocationStatus = namedtuple("RevocationStatus", "status revocation_date reason stale")
+
+_UNKNOWN_STATUS = RevocationStatus(UNKNOWN, None, None, False)
+_NOT_REVOKED_STATUS = RevocationStatus(NOT_REVOKED, None, None, False)
+_NOT_REVOKED_STALE_STATUS = RevocationStatus(NOT_REVOKED, None, None, True)
+
+
+def _issuer_and_serial(cert):
+    if isinstance(cert, CertificateSummary):
+        return cert.issuer_key, cert.serial_number
+    tbs = cert.tbsCertificate
+    return tbs.issuer.digest(), tbs.serial_number
+
+
+def check_revocation(certs, at=None, store=None, prefilter=None):
+    '''
+    Returns list of RevocationStatus of certificates (X509Certificates or
+    CertificateSummaries) at date at (datetime, UTC; now by default).
+    Certificates are grouped by issuer, so every CRL is found and checked
+    for staleness once, and the serial numbers of each issuer are looked
+    up together (see RevocationIndex.lookup_many).
+    @param store: RevocationStore or RevocationFile (revocation_store by
+        default)
+    @param prefilter: revocation_filter.RevocationFilter of the store;
+        certificates it rules out are not looked up in the store, unless it
+        is stale for their issuer (see RevocationFilter.covers)
+    '''
+    if at is None:
+        at = datetime.datetime.utcnow()
+    if store is None:
+        store = revocation_store
+    groups = {}     # issuer digest -> (positions, serial numbers)
+    count = 0
+    for cert in certs:
+        issuerDigest, serial = _issuer_and_serial(cert)
+        group = groups.get(issuerDigest)
+        if group is None:
+            group = groups[issuerDigest] = ([], [])
+        group[0].append(count)
+        group[1].append(serial)
+        count += 1
+
+    results = [_UNKNOWN_STATUS] * count
+    for issuerDigest, (positions, serials) in groups.iteritems():
+        index = store.get_by_digest(issuerDigest)
+        if index is None:
+            continue
+        stale = index.next_update is not None and index.next_update < at
+        notRevoked = _NOT_REVOKED_STALE_STATUS if stale else _NOT_REVOKED_STATUS
+        if prefilter is not None and prefilter.covers(index):
+            candidates = []
+            for position, serial in zip(positions, serials):
+                if prefilter.might_contain_digest(issuerDigest, serial):
+                    candidates.append((position, serial))
+                else:
+                    results[position] = notRevoked
+            positions = [position for (position, serial) in candidates]
+            serials = [serial for (position, serial) in candidates]
+        for position, entry in zip(positions, index.lookup_many(serials)):
+            if entry is None or entry.revocation_date > at:
+                results[position] = notRevoked
+            else:
+                results[position] = RevocationStatus(REVOKED, entry.revocation_date,
+                                                     entry.reason, stale)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print >> sys.stderr, "Usage: crl_parse.py crl [serial_number ...]"
+        sys.exit(1)
+
+    crlIndex = read_crl(sys.argv[1])
+    print "Issuer:", crlIndex.issuer
+    print "This update:", crlIndex.this_update
+    print "Next update:", crlIndex.next_update
+    print "CRL number:", crlIndex.crl_number
+    print "Revoked certificates:", len(crlIndex)
+    for serialArg in sys.argv[2:]:
+        entry = crlIndex.lookup(long(serialArg, 0))
+        if entry is None:
+            print "%s: not revoked" % serialArg
+        else:
+            print "%s: revoked %s, reason %s" % (serialArg, entry.revocation_date, entry.reason)
@@ -0,0 +1,206 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Parse sessions.
+
+ParseSession groups the state used while parsing: caches of shared values
+(names, extension values, public keys, DSA domain parameters and optionally
+whole certificates), the OID registry and the spec templates. Sessions do
+not share their caches, so e.g. every tenant of a service can have its own
+cache budget. Parsing outside of any session uses default_session, which
+holds the process-wide caches.
+
+A session is active in the current thread inside its with statement, or
+during x509_parse(), pkcs7_parse() and decode_qts() calls it is passed to.
+Models built from decoded structures (e.g. SignerInfo) use the caches of
+the active session, so they should be built inside the with statement too.
+Sessions can be nested.
+'''
+
+import gc
+import threading
+from contextlib import contextmanager
+
+from caches import LRUCache, CacheManager
+from pkcs7.asn1_models import oid_registry
+from pkcs7.asn1_models.oid_registry import OidRegistry
+from pkcs7.asn1_models.spec_templates import templates as defaultTemplates
+
+# GC policies of ParseSession.batch()
+GC_KEEP = "keep"            # leave the cyclic garbage collector alone
+GC_DISABLE = "disable"      # disable it during the batch
+
+
+class ParseSession(object):
+    '''
+    Attributes:
+    - name_cache, extension_cache, key_cache, dss_params_cache (LRUCache
+      of shared Names, extension values, PublicKeyInfos and DSA (p, q, g))
+    - parse_cache (caches.X509ParseCache used by x509_parse when no cache
+      is passed to it, or None)
+    - oid_registry (by default one that knows all OIDs of the default
+      registry, but keeps unknown OIDs seen in this session to itself)
+    - templates (spec_templates.SpecTemplates of all structures decoded
+      in the session; templates are never modified, so sessions share the
+      default ones unless told otherwise)
+    - gc_policy (GC_KEEP or GC_DISABLE, see batch())
+    - manager (caches.CacheManager keeping all the caches within max_bytes
+      if it was given, else None; revocation stores are not part of the
+      session, but can be counted into the budget by manager.track())
+    '''
+
+    # relative costs of recomputing a byte of entries of the caches, used
+    # by the CacheManager to decide what to evict first (sizes of the
+    # entries are measured, see caches.estimate_size)
+    CACHE_COSTS = {
+        "names": 1.0,
+        "extensions": 2.0,
+        "keys": 4.0,
+        "dss_params": 4.0,
+        "certificates": 8.0,
+    }
+
+    def __init__(self, name_cache=None, extension_cache=None, key_cache=None,
+                 dss_params_cache=None, parse_cache=None, oid_registry=None,
+                 templates=None, gc_policy=GC_KEEP, max_bytes=None):
+        if name_cache is None:
+            name_cache = LRUCache(max_entries=4096)
+        if extension_cache is None:
+            extension_cache = LRUCache(max_entries=4096)
+        if key_cache is None:
+            key_cache = LRUCache(max_entries=4096)
+        if dss_params_cache is None:
+            dss_params_cache = LRUCache(max_entries=256)
+        if oid_registry is None:
+            oid_registry = OidRegistry(parent=_defaultRegistry)
+        if templates is None:
+            templates = defaultTemplates
+        self.name_cache = name_cache
+        self.extension_cache = extension_cache
+        self.key_cache = key_cache
+        self.dss_params_cache = dss_params_cache
+        self.parse_cache = parse_cache
+        self.oid_registry = oid_registry
+        self.templates = templates
+        if gc_policy not in (GC_KEEP, GC_DISABLE):
+            raise ValueError("Unknown GC policy %r" % gc_policy)
+        self.gc_policy = gc_policy
+        self.manager = None
+        if max_bytes is not None:
+            self.manager = CacheManager(max_bytes)
+            for name, cache in self.caches().iteritems():
+                self.manager.register(name, cache, ParseSession.CACHE_COSTS[name])
+
+    def caches(self):
+        '''
+        Returns dictionary of the caches of this session.
+        '''
+        caches = {
+            "names": self.name_cache,
+            "extensions": self.extension_cache,
+            "keys": self.key_cache,
+            "dss_params": self.dss_params_cache,
+        }
+        if self.parse_cache is not None:
+            caches["certificates"] = self.parse_cache
+        return caches
+
+    def stats(self):
+        '''
+        Returns dictionary of LRUCache.stats() of the caches (or
+        CacheManager.stats() if the session has max_bytes).
+        '''
+        if self.manager is not None:
+            return self.manager.stats()
+        return dict((name, cache.stats()) for (name, cache) in self.caches().iteritems())
+
+    def clear(self):
+        for cache in self.caches().itervalues():
+            cache.clear()
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append((self, oid_registry.set_active(self.oid_registry)))
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        session, previousRegistry = _local.stack.pop()
+        oid_registry.set_active(previousRegistry)
+        return False
+
+    @contextmanager
+    def batch(self):
+        '''
+        Context manager for parsing many objects: activates the session and
+        applies gc_policy. With GC_DISABLE the cyclic garbage collector is
+        disabled until the last running batch (of any session or thread)
+        ends, so that it does not repeatedly scan the many objects created
+        while parsing. Reference counting still frees them; only garbage
+        in reference cycles waits for the end of the batch.
+        '''
+        disable = self.gc_policy == GC_DISABLE
+        if disable:
+            _disable_gc()
+        try:
+            with self:
+                yield self
+        finally:
+            if disable:
+                _restore_gc()
+
+
+_local = threading.local()
+
+_gcLock = threading.Lock()
+_gcDisabled = 0
+_gcWasEnabled = False
+
+
+def _disable_gc():
+    global _gcDisabled, _gcWasEnabled
+    with _gcLock:
+        if _gcDisabled == 0:
+            _gcWasEnabled = gc.isenabled()
+            gc.disable()
+        _gcDisabled += 1
+
+
+def _restore_gc():
+    global _gcDisabled
+    with _gcLock:
+        _gcDisabled -= 1
+        if _gcDisabled == 0 and _gcWasEnabled:
+            gc.enable()
+
+
+_defaultRegistry = oid_registry.registry
+
+# session used when none is active
+default_session = ParseSession(oid_registry=_defaultRegistry)
+
+
+def current_session():
+    '''
+    Returns session active in the current thread (default_session if none).
+    '''
+    stack = getattr(_local, "stack", None)
+    if stack:
+        return stack[-1][0]
+    return default_session
@@ -149,7 +149,10 @@ class NameConstraints(univ.Sequence):
                     GeneralSubtrees().subtype(implicitTag=tag.Tag(tag.tagClassContext, tag.tagFormatConstructed, 0x1))),
                                          )
 
-class NetscapeCertType(univ.BitString):
+class KeyUsage(ConvertibleBitString):
+    pass
+
+class NetscapeCertType(ConvertibleBitString):
     pass
 
 class ExtensionValue(univ.Choice):
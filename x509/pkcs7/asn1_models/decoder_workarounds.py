@@ -1,7 +1,12 @@
-from pyasn1.type import univ
+import mmap
+
+from pyasn1.type import univ, tag
+from pyasn1 import error
 from pyasn1.codec.ber import decoder as berDecoder
 from pyasn1.codec.der import decoder as derDecoder
 
+import oid_registry
+
 # Clone stock DER decoder and replace its boolean handler so that it permits
 # BER encoding of boolean (i.e. 0 => False, anything else => True).
 # According to spec, CER/DER should only accept 0 as False and 0xFF as True.
@@ -15,5 +20,84 @@ class BooleanFixDerDecoder(derDecoder.Decoder): pass
 booleanFixTagMap = derDecoder.tagMap.copy()
 booleanFixTagMap[univ.Boolean.tagSet] = berDecoder.BooleanDecoder()
 
+
+class OctetKeepingBitStringDecoder(berDecoder.BitStringDecoder):
+    '''
+    BIT STRING decoder that hands the content octets straight to types
+    able to keep them (see general_types.ConvertibleBitString) instead of
+    expanding them to a tuple of bits one by one.
+    '''
+    def valueDecoder(self, fullSubstrate, substrate, asn1Spec, tagSet, length,
+                     state, decodeFun, substrateFun):
+        if tagSet[0][1] == tag.tagFormatSimple and length and \
+                not substrateFun and hasattr(asn1Spec, "cloneFromOctets"):
+            head, tail = substrate[:length], substrate[length:]
+            unusedBits = ord(head[0])
+            if unusedBits > 7:
+                raise error.PyAsn1Error('Trailing bits overflow %s' % unusedBits)
+            return asn1Spec.cloneFromOctets(head[1:], unusedBits), tail
+        return berDecoder.BitStringDecoder.valueDecoder(self, fullSubstrate,
+            substrate, asn1Spec, tagSet, length, state, decodeFun, substrateFun)
+
+booleanFixTagMap[univ.BitString.tagSet] = OctetKeepingBitStringDecoder()
+
+
+class RegistryObjectIdentifierDecoder(berDecoder.ObjectIdentifierDecoder):
+    '''
+    OBJECT IDENTIFIER decoder that finds OIDs in the active oid_registry by
+    their content octets and attaches the registry entry to the decoded
+    value (as _oidEntry).
+    '''
+    def valueDecoder(self, fullSubstrate, substrate, asn1Spec, tagSet, length,
+                     state, decodeFun, substrateFun):
+        head = substrate[:length]
+        oidRegistry = oid_registry.active()
+        entry = oidRegistry.lookup(head)
+        if entry is None:
+            r, tail = berDecoder.ObjectIdentifierDecoder.valueDecoder(self,
+                fullSubstrate, substrate, asn1Spec, tagSet, length, state,
+                decodeFun, substrateFun)
+            entry = oidRegistry.remember(head, r._value)
+        else:
+            r, tail = self._createComponent(asn1Spec, tagSet, entry.value), substrate[length:]
+        if entry is not None:
+            r._oidEntry = entry
+        return r, tail
+
+booleanFixTagMap[univ.ObjectIdentifier.tagSet] = RegistryObjectIdentifierDecoder()
+
+
+class ContentKeepingSequenceOfDecoder(berDecoder.SequenceOfDecoder):
+    '''
+    SEQUENCE OF decoder that hands the content octets to types able to
+    decode their components on demand (see general_types.RDNSequence)
+    instead of decoding the components right away.
+    '''
+    def valueDecoder(self, fullSubstrate, substrate, asn1Spec, tagSet, length,
+                     state, decodeFun, substrateFun):
+        if not substrateFun and hasattr(asn1Spec, "cloneFromContent"):
+            head, tail = substrate[:length], substrate[length:]
+            return asn1Spec.cloneFromContent(head), tail
+        return berDecoder.SequenceOfDecoder.valueDecoder(self, fullSubstrate,
+            substrate, asn1Spec, tagSet, length, state, decodeFun, substrateFun)
+
+contentKeepingTypeMap = derDecoder.typeMap.copy()
+contentKeepingTypeMap[univ.SequenceOf.typeId] = ContentKeepingSequenceOfDecoder()
+
 # Instantiate our modified DER decoder
-decode = BooleanFixDerDecoder(booleanFixTagMap, derDecoder.typeMap)
+decode = BooleanFixDerDecoder(booleanFixTagMap, contentKeepingTypeMap)
+
+
+def as_substrate(data):
+    """
+    Returns data in the form the decoder accepts (str).
+    str is passed as is. bytearray, mmap, memoryview and buffer objects are
+    copied once, in C, instead of being accessed byte by byte from Python.
+    """
+    if isinstance(data, str):
+        return data
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    if isinstance(data, mmap.mmap):
+        return data[:]
+    return str(data)
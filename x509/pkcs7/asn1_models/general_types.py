@@ -28,29 +28,104 @@ from pyasn1 import error
 # local imports
 from tools import *
 from oid import *
+from decoder_workarounds import decode
 
 
 class ConvertibleBitString(univ.BitString):
     '''
     Extends uni.BitString with method that converts value
     to the octet string.
+    When decoded by our decoder, the original content octets and the count
+    of unused bits are kept, so toOctets() and bit access work on bytes and
+    the tuple of bits (_value) is built only when somebody asks for it.
     '''
-    
+    _octets = None
+    _unusedBits = 0
+
+    def __getattr__(self, name):
+        # instances made by cloneFromOctets have no _value until it is needed
+        if name == '_value' and self._octets is not None:
+            self._value = self._octetsToBits()
+            return self._value
+        raise AttributeError(name)
+
+    def cloneFromOctets(self, octets, unusedBits=0):
+        '''
+        Returns new instance of this type holding DER content octets
+        (without the leading unused-bits octet).
+        '''
+        r = self.clone(())
+        del r._value
+        r._octets = octets
+        r._unusedBits = unusedBits
+        return r
+
+    def _octetsToBits(self):
+        bits = []
+        for octet in self._octets:
+            o = ord(octet)
+            bits.extend(((o >> 7) & 1, (o >> 6) & 1, (o >> 5) & 1, (o >> 4) & 1,
+                         (o >> 3) & 1, (o >> 2) & 1, (o >> 1) & 1, o & 1))
+        if self._unusedBits:
+            del bits[-self._unusedBits:]
+        return tuple(bits)
+
+    def __len__(self):
+        if self._octets is not None:
+            return len(self._octets) * 8 - self._unusedBits
+        return univ.BitString.__len__(self)
+
+    def __getitem__(self, i):
+        if self._octets is not None and not isinstance(i, slice):
+            length = len(self)
+            if i < 0:
+                i += length
+            if i < 0 or i >= length:
+                raise IndexError('bit index out of range')
+            return (ord(self._octets[i >> 3]) >> (7 - (i & 7))) & 1
+        return univ.BitString.__getitem__(self, i)
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def __hash__(self):
+        return hash(self._value)
+
     def toOctets(self):
         '''
-        Converts bit string into octets string
+        Converts bit string into octets string.
+        Only complete octets are returned, i.e. trailing partial octet
+        (with unused bits) is dropped.
         '''
-        def _tuple_to_byte(tuple):          
-          return chr(int(''.join(map(str, tuple)),2))
-      
-        res = ''        
-        byte_len = len(self._value) / 8
-        for byte_idx in xrange(byte_len):
-            bit_idx = byte_idx * 8
-            byte_tuple = self._value[bit_idx:bit_idx + 8]
-            byte = _tuple_to_byte(byte_tuple)            
-            res += byte
-        return res
+        if self._octets is not None:
+            if self._unusedBits:
+                return self._octets[:-1]
+            return self._octets
+
+        bits = self._value
+        byte_len = len(bits) / 8
+        res = []
+        for bit_idx in xrange(0, byte_len * 8, 8):
+            res.append(chr(int(''.join(map(str, bits[bit_idx:bit_idx + 8])), 2)))
+        return ''.join(res)
+
+    def toContentOctets(self):
+        '''
+        Returns DER content octets: the count of unused bits followed by
+        all octets, including the trailing partial one. Unlike toOctets(),
+        bit strings of different lengths never give the same result, so it
+        can be used as their key.
+        '''
+        if self._octets is not None:
+            return chr(self._unusedBits) + self._octets
+
+        bits = tuple(self._value)
+        unusedBits = -len(bits) % 8
+        bits += (0,) * unusedBits
+        res = [chr(unusedBits)]
+        for bit_idx in xrange(0, len(bits), 8):
+            res.append(chr(int(''.join(map(str, bits[bit_idx:bit_idx + 8])), 2)))
+        return ''.join(res)
 
 class DirectoryString(univ.Choice):    
     componentType = namedtype.NamedTypes(
@@ -77,7 +152,7 @@ class AttributeValue(DirectoryString): pass
 
 class AttributeType(univ.ObjectIdentifier): 
     def __str__(self):
-        return tuple_to_OID(self._value)
+        return tuple_to_OID(self)
 
 class AttributeTypeAndValue(univ.Sequence):
     componentType = namedtype.NamedTypes(
@@ -106,8 +181,33 @@ class RelativeDistinguishedName(univ.SetOf):
         return buf
 
 class RDNSequence(univ.SequenceOf):
+    '''
+    When decoded by our decoder, only the content octets are kept and the
+    RDNs are decoded on first access to them. The content octets stay
+    available in _substrate and serve as key of decoded names.
+    '''
     componentType = RelativeDistinguishedName()
-    
+    _substrate = None
+
+    def cloneFromContent(self, substrate):
+        r = self.clone()
+        del r._componentValues
+        r._substrate = substrate
+        return r
+
+    def __getattr__(self, attr):
+        if attr == "_componentValues" and self._substrate is not None:
+            values = []
+            head = self._substrate
+            componentType = self.getComponentType()
+            while head:
+                component, head = decode(head, asn1Spec=componentType)
+                values.append(component)
+            self._componentValues = values
+            self._componentValuesSet = len(values)
+            return values
+        raise AttributeError(attr)
+
     def __str__(self):
         buf = ''        
         for component in self._componentValues:            
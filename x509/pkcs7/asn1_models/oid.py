@@ -49,6 +49,7 @@ oid_map = {
        "2.5.29.20" : "CRL Number",
        "2.5.29.21" : "Reason Code",
        "2.5.29.24" : "Invalidity Data",
+       "2.5.29.27" : "Delta CRL Indicator",
        
        
        "1.2.840.113549.1.9.3" : "contentType",
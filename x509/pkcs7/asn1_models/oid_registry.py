@@ -0,0 +1,169 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Registry of OIDs known to the library.
+
+For every registered OID the DER content octets, the tuple of arcs and the
+dotted string are computed once. Our decoder looks OIDs up by their content
+octets, so known OIDs are neither decoded arc by arc nor converted to dotted
+strings over and over; the entry found is attached to the decoded OID and
+tuple_to_OID() just returns its dotted string.
+OIDs not registered are decoded the usual way and remembered (up to
+max_unknown of them) when first seen.
+
+The decoder uses the registry made active in the current thread by
+set_active() (e.g. by a parse session), or the default registry.
+'''
+
+import threading
+
+from oid import oid_map
+
+
+class OidEntry(object):
+    '''
+    One OID: dotted string, tuple of arcs (value) and DER content octets.
+    '''
+    __slots__ = ("dotted", "value", "der")
+
+    def __init__(self, dotted, value, der):
+        self.dotted = dotted
+        self.value = value
+        self.der = der
+
+    def __repr__(self):
+        return "OidEntry(%s)" % self.dotted
+
+
+def encode_oid_content(value):
+    '''
+    Returns DER content octets of OID given as tuple of arcs.
+    '''
+    arcs = [value[0] * 40 + value[1]] + list(value[2:])
+    octets = []
+    for arc in arcs:
+        chunk = [chr(arc & 0x7f)]
+        arc >>= 7
+        while arc:
+            chunk.append(chr(0x80 | (arc & 0x7f)))
+            arc >>= 7
+        chunk.reverse()
+        octets.extend(chunk)
+    return "".join(octets)
+
+
+class OidRegistry(object):
+    '''
+    If parent registry is given, OIDs known to it are found as well, but
+    OIDs registered or remembered later are kept in this registry only.
+    Lookups do not lock; writes are serialized by a lock of the registry,
+    as the default registry is shared by all threads parsing without
+    a registry of their own.
+    '''
+
+    def __init__(self, max_unknown=4096, parent=None):
+        self.max_unknown = max_unknown
+        self.parent = parent
+        self._byDer = {}
+        self._byValue = {}
+        self._unknownCount = 0
+        self._lock = threading.Lock()
+
+    def register(self, *dottedOids):
+        for dotted in dottedOids:
+            value = tuple(int(arc) for arc in dotted.split("."))
+            with self._lock:
+                if value in self:
+                    continue
+                entry = OidEntry(intern(dotted), value, encode_oid_content(value))
+                self._byDer[entry.der] = entry
+                self._byValue[value] = entry
+
+    def lookup(self, der):
+        '''
+        Returns entry of OID with given content octets or None.
+        '''
+        entry = self._byDer.get(der)
+        if entry is None and self.parent is not None:
+            entry = self.parent.lookup(der)
+        return entry
+
+    def _entry(self, value):
+        entry = self._byValue.get(value)
+        if entry is None and self.parent is not None:
+            entry = self.parent._entry(value)
+        return entry
+
+    def remember(self, der, value):
+        '''
+        Adds entry of an unregistered OID seen by the decoder. Returns the
+        entry or None if there are already max_unknown of them.
+        '''
+        with self._lock:
+            entry = self._byDer.get(der)
+            if entry is not None:
+                # remembered by another thread meanwhile
+                return entry
+            if self._unknownCount >= self.max_unknown:
+                return None
+            entry = OidEntry(".".join([str(arc) for arc in value]), value, der)
+            self._byDer[der] = entry
+            self._byValue.setdefault(value, entry)
+            self._unknownCount += 1
+            return entry
+
+    def dotted(self, value):
+        '''
+        Returns dotted string of OID given as tuple of arcs.
+        '''
+        entry = self._entry(value)
+        if entry is not None:
+            return entry.dotted
+        return ".".join([str(arc) for arc in value])
+
+    def __contains__(self, oid):
+        '''
+        oid is dotted string or tuple of arcs.
+        '''
+        if isinstance(oid, basestring):
+            oid = tuple(int(arc) for arc in oid.split("."))
+        return self._entry(oid) is not None
+
+
+# default registry used by our decoder
+registry = OidRegistry()
+registry.register(*oid_map)
+
+_local = threading.local()
+
+
+def active():
+    '''
+    Returns registry active in the current thread.
+    '''
+    return getattr(_local, "registry", None) or registry
+
+
+def set_active(activeRegistry):
+    '''
+    Makes activeRegistry (None for the default one) active in the current
+    thread. Returns the previously active registry (or None).
+    '''
+    previous = getattr(_local, "registry", None)
+    _local.registry = activeRegistry
+    return previous
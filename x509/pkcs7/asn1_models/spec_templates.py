@@ -0,0 +1,94 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Registry of prebuilt ASN.1 spec templates passed as asn1Spec to decode().
+
+Guarantee: templates are never mutated during decoding. The decoder only
+reads the spec it is given; values are always created by clone()-ing it
+(clone() for constructed types, clone(value) for simple ones, and
+cloneFromOctets() for our bit strings). Therefore one template per spec
+class is shared by all decode calls. Code must never call
+setComponentBy*() or similar on an object obtained from the registry.
+
+Tag maps of a template and of all its components are computed when it is
+registered, so the first decode does not pay for building them.
+'''
+
+
+def _prepare_tag_maps(spec, seen):
+    '''
+    Asks spec and all its components for the tag maps the decoder uses, so
+    that they get computed and cached.
+    '''
+    if id(spec) in seen:
+        return
+    seen.add(id(spec))
+    spec.getTagMap()
+    if not hasattr(spec, "getComponentType"):
+        return
+    componentType = spec.getComponentType()
+    if componentType is None:
+        return
+    if hasattr(spec, "getComponentTagMapNearPosition"):
+        # Sequence
+        for idx in xrange(len(componentType)):
+            spec.getComponentTagMapNearPosition(idx)
+    else:
+        # Set, Choice, SetOf, SequenceOf
+        spec.getComponentTagMap()
+    if hasattr(componentType, "getTypeByPosition"):
+        for idx in xrange(len(componentType)):
+            _prepare_tag_maps(componentType.getTypeByPosition(idx), seen)
+    else:
+        _prepare_tag_maps(componentType, seen)
+
+
+class SpecTemplates(object):
+    '''
+    Spec class -> shared template instance.
+    '''
+
+    def __init__(self):
+        self._templates = {}
+
+    def register(self, *specClasses):
+        for specClass in specClasses:
+            if specClass not in self._templates:
+                template = specClass()
+                _prepare_tag_maps(template, set())
+                self._templates[specClass] = template
+
+    def get(self, specClass):
+        '''
+        Returns the template of specClass, building it on first use.
+        None is passed through (decoding without spec).
+        '''
+        if specClass is None:
+            return None
+        template = self._templates.get(specClass)
+        if template is None:
+            self.register(specClass)
+            template = self._templates[specClass]
+        return template
+
+    def __contains__(self, specClass):
+        return specClass in self._templates
+
+
+# default registry used by all decode entry points
+templates = SpecTemplates()
@@ -22,6 +22,8 @@ Some useful tools for working with ASN1 components.
 
 # dslib imports
 from decoder_workarounds import decode
+from spec_templates import templates
+import oid_registry
 from pyasn1 import error
 
 # local imports
@@ -29,50 +31,66 @@ from RSA import RsaPubKey
 from DSA import DssParams, DsaPubKey
 
 
-def tuple_to_OID(tuple):
+def tuple_to_OID(oid):
     """
-    Converts OID tuple to OID string
+    Converts OID tuple (or decoded ObjectIdentifier) to OID string
     """
-    l = len(tuple)
-    buf = ''
-    for idx in xrange(l):
-        if (idx < l-1):
-            buf += str(tuple[idx]) + '.'
-        else:
-            buf += str(tuple[idx])
-    return buf
+    entry = getattr(oid, "_oidEntry", None)
+    if entry is not None:
+        return entry.dotted
+    if hasattr(oid, "asTuple"):
+        oid = oid.asTuple()
+    return oid_registry.active().dotted(tuple(oid))
 
-def get_RSA_pub_key_material(subjectPublicKeyAsn1):
+def get_RSA_pub_key_material(subjectPublicKeyAsn1, specTemplates=None):
     '''
     Extracts modulus and public exponent from 
-    ASN1 bitstring component subjectPublicKey
+    ASN1 bitstring component subjectPublicKey.
+    specTemplates (SpecTemplates) default to the global templates.
     '''
-    # create template for decoder
-    rsa_key = RsaPubKey()
+    if specTemplates is None:
+        specTemplates = templates
     # convert ASN1 subjectPublicKey component from BITSTRING to octets
     pubkey = subjectPublicKeyAsn1.toOctets()
     
-    key = decode(pubkey, asn1Spec=rsa_key)[0]
+    key = decode(pubkey, asn1Spec=specTemplates.get(RsaPubKey))[0]
     
     mod = key.getComponentByName("modulus")._value
     exp = key.getComponentByName("exp")._value
     
     return {'mod': mod, 'exp': exp}
     
-def get_DSA_pub_key_material(subjectPublicKeyAsn1, parametersAsn1):
+def get_DSA_pub_key_material(subjectPublicKeyAsn1, parametersAsn1, paramsCache=None,
+                             specTemplates=None):
     '''
     Extracts DSA parameters p, q, g from
     ASN1 bitstring component subjectPublicKey and parametersAsn1 from
     'parameters' field of AlgorithmIdentifier.
+    If paramsCache (LRUCache) is given, decoded (p, q, g) triples are kept
+    there keyed by their encoding, so keys with the same domain parameters
+    share the numbers and the parameters are decoded only once.
+    specTemplates (SpecTemplates) default to the global templates.
     '''
+    if specTemplates is None:
+        specTemplates = templates
     pubkey = subjectPublicKeyAsn1.toOctets()
     
-    key = decode(pubkey, asn1Spec=DsaPubKey())[0]
-    parameters = decode(str(parametersAsn1), asn1Spec=DssParams())[0]
+    key = decode(pubkey, asn1Spec=specTemplates.get(DsaPubKey))[0]
     paramDict = {"pub": int(key)}
-    
-    for param in ['p', 'q', 'g']:
-        paramDict[param] = parameters.getComponentByName(param)._value
-        
+
+    encodedParams = str(parametersAsn1)
+    params = None
+    if paramsCache is not None:
+        params = paramsCache.get(encodedParams)
+    if params is None:
+        parameters = decode(encodedParams, asn1Spec=specTemplates.get(DssParams))[0]
+        params = tuple([parameters.getComponentByName(param)._value
+                        for param in ['p', 'q', 'g']])
+        if paramsCache is not None:
+            paramsCache.put(encodedParams, params)
+
+    paramDict["p"], paramDict["q"], paramDict["g"] = params
     return paramDict
-    
+
+
+templates.register(RsaPubKey, DsaPubKey, DssParams)
@@ -0,0 +1,220 @@
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Index of the DER skeleton of X.509 certificates.
+
+The outer Certificate and TBSCertificate structures are walked once, TLV by
+TLV, without building any pyasn1 objects. The result tells where each
+top-level field lies, so single fields can be decoded straight from their
+byte slices and exact raw spans (e.g. of tbsCertificate for signature
+checking) are available.
+'''
+
+# dslib imports
+from pyasn1 import error
+
+TAG_INTEGER = 0x02
+TAG_BIT_STRING = 0x03
+TAG_SEQUENCE = 0x30
+
+TAG_VERSION = 0xa0              # [0] EXPLICIT Version
+TAG_ISSUER_UID = 0x81           # [1] IMPLICIT UniqueIdentifier
+TAG_SUBJECT_UID = 0x82          # [2] IMPLICIT UniqueIdentifier
+TAG_EXTENSIONS = 0xa3           # [3] EXPLICIT Extensions
+
+
+def read_tlv(data, offset, end=None):
+    '''
+    Reads identifier and length octets of the TLV starting at offset.
+    Returns tuple (tag, content offset, content length).
+    Only low tag numbers and definite lengths are accepted, which is all DER
+    needs for certificates.
+    '''
+    if end is None:
+        end = len(data)
+    if offset + 2 > end:
+        raise error.SubstrateUnderrunError(
+            'Short substrate for TLV header at offset %d' % offset)
+    tag = ord(data[offset])
+    if tag & 0x1f == 0x1f:
+        raise error.PyAsn1Error('High tag number at offset %d not supported' % offset)
+    first = ord(data[offset + 1])
+    pos = offset + 2
+    if first < 0x80:
+        length = first
+    elif first == 0x80:
+        raise error.PyAsn1Error('Indefinite length at offset %d is not DER' % offset)
+    else:
+        size = first & 0x7f
+        if pos + size > end:
+            raise error.SubstrateUnderrunError(
+                'Short substrate for length octets at offset %d' % offset)
+        length = 0
+        for idx in xrange(pos, pos + size):
+            length = (length << 8) | ord(data[idx])
+        pos += size
+    if pos + length > end:
+        raise error.SubstrateUnderrunError(
+            '%d-octet short TLV at offset %d' % (pos + length - end, offset))
+    return tag, pos, length
+
+
+def iter_tlvs(data, offset, end):
+    '''
+    Iterates over consecutive TLVs in data[offset:end].
+    Yields tuples (tag, offset, content offset, content length).
+    '''
+    while offset < end:
+        tag, contentOffset, length = read_tlv(data, offset, end)
+        yield tag, offset, contentOffset, length
+        offset = contentOffset + length
+
+
+class CertificateIndex(object):
+    '''
+    Skeleton of a DER encoded certificate.
+    Every field is described by a tuple (tag, offset, length), where offset
+    points to the first octet of the field's TLV and length is the length of
+    the whole TLV including its header, so data[offset:offset+length] is the
+    exact encoding of the field.
+    Attributes:
+    - data (the indexed substrate)
+    - table (tuple of field descriptors in FIELDS order, None for absent
+      optional fields)
+    '''
+    FIELDS = (
+        "certificate",
+        "tbsCertificate",
+        "version",
+        "serialNumber",
+        "signature",
+        "issuer",
+        "validity",
+        "subject",
+        "subjectPublicKeyInfo",
+        "issuerUniqueID",
+        "subjectUniqueID",
+        "extensions",
+        "signatureAlgorithm",
+        "signatureValue",
+    )
+    _positions = dict((name, pos) for (pos, name) in enumerate(FIELDS))
+
+    def __init__(self, data, table):
+        self.data = data
+        self.table = table
+
+    def get(self, name):
+        '''
+        Returns (tag, offset, length) of the field or None if the optional
+        field is not present.
+        '''
+        return self.table[CertificateIndex._positions[name]]
+
+    def span(self, name):
+        '''
+        Returns (start, end) offsets of the field's TLV or None.
+        '''
+        field = self.get(name)
+        if field is None:
+            return None
+        return field[1], field[1] + field[2]
+
+    def raw(self, name):
+        '''
+        Returns the DER encoding of the field (header included) or None.
+        '''
+        field = self.get(name)
+        if field is None:
+            return None
+        return self.data[field[1]:field[1] + field[2]]
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+def _expect(tag, expectedTag, name, offset):
+    if tag != expectedTag:
+        raise error.PyAsn1Error('Unexpected tag 0x%02x of %s at offset %d' % (tag, name, offset))
+
+
+def index_certificate(derData):
+    '''
+    Walks the Certificate and TBSCertificate structures of derData and
+    returns a CertificateIndex. No pyasn1 objects are built.
+    Raises PyAsn1Error (or SubstrateUnderrunError) if the skeleton is broken.
+    '''
+    if isinstance(derData, bytearray):
+        derData = buffer(derData)
+    table = [None] * len(CertificateIndex.FIELDS)
+    pos = CertificateIndex._positions
+
+    tag, certContent, certLen = read_tlv(derData, 0)
+    _expect(tag, TAG_SEQUENCE, "certificate", 0)
+    certEnd = certContent + certLen
+    table[pos["certificate"]] = (tag, 0, certEnd)
+
+    # Certificate ::= SEQUENCE { tbsCertificate, signatureAlgorithm, signatureValue }
+    outer = iter_tlvs(derData, certContent, certEnd)
+    for name, expectedTag in (("tbsCertificate", TAG_SEQUENCE),
+                              ("signatureAlgorithm", TAG_SEQUENCE),
+                              ("signatureValue", TAG_BIT_STRING)):
+        try:
+            tag, offset, contentOffset, length = outer.next()
+        except StopIteration:
+            raise error.PyAsn1Error('Missing %s in certificate' % name)
+        _expect(tag, expectedTag, name, offset)
+        table[pos[name]] = (tag, offset, contentOffset + length - offset)
+    lastTag, lastOffset, lastLen = table[pos["signatureValue"]]
+    if lastOffset + lastLen != certEnd:
+        raise error.PyAsn1Error('Trailing data in certificate at offset %d' % (lastOffset + lastLen))
+
+    tbsTag, tbsOffset, tbsLen = table[pos["tbsCertificate"]]
+    tbsContent, tbsContentLen = read_tlv(derData, tbsOffset)[1:]
+    tlvs = list(iter_tlvs(derData, tbsContent, tbsContent + tbsContentLen))
+    idx = 0
+    if tlvs and tlvs[0][0] == TAG_VERSION:
+        tag, offset, contentOffset, length = tlvs[0]
+        table[pos["version"]] = (tag, offset, contentOffset + length - offset)
+        idx = 1
+
+    for name, expectedTag in (("serialNumber", TAG_INTEGER),
+                              ("signature", TAG_SEQUENCE),
+                              ("issuer", TAG_SEQUENCE),
+                              ("validity", TAG_SEQUENCE),
+                              ("subject", TAG_SEQUENCE),
+                              ("subjectPublicKeyInfo", TAG_SEQUENCE)):
+        if idx >= len(tlvs):
+            raise error.PyAsn1Error('Missing %s in tbsCertificate' % name)
+        tag, offset, contentOffset, length = tlvs[idx]
+        _expect(tag, expectedTag, name, offset)
+        table[pos[name]] = (tag, offset, contentOffset + length - offset)
+        idx += 1
+
+    # optional fields must come in this order
+    for name, expectedTag in (("issuerUniqueID", TAG_ISSUER_UID),
+                              ("subjectUniqueID", TAG_SUBJECT_UID),
+                              ("extensions", TAG_EXTENSIONS)):
+        if idx < len(tlvs) and tlvs[idx][0] == expectedTag:
+            tag, offset, contentOffset, length = tlvs[idx]
+            table[pos[name]] = (tag, offset, contentOffset + length - offset)
+            idx += 1
+    if idx < len(tlvs):
+        raise error.PyAsn1Error('Unexpected tag 0x%02x in tbsCertificate at offset %d' % tlvs[idx][:2])
+
+    return CertificateIndex(derData, tuple(table))
@@ -20,10 +20,9 @@
 Decoding of PKCS7 messages
 '''
 
-from cStringIO import StringIO
-
 # dslib imports
-from asn1_models.decoder_workarounds import decode
+from asn1_models.decoder_workarounds import decode, as_substrate
+from asn1_models.spec_templates import templates
 from pyasn1 import error
 
 # local imports
@@ -32,88 +31,48 @@ from asn1_models.digest_info import *
 from asn1_models.TST_info import *
 
 
-class StringView(object):
-  
-  def __init__(self, string, start, end):
-    self._string = string
-    self._start = start
-    if end == None:
-      self._end = len(string)
-    else:
-      self._end = end 
-
-  def __len__(self):
-    return self._end - self._start
-  
-  def __getitem__(self, key):
-    if type(key) == int:
-      if key < 0:
-        self._string.seek(self._end+key)
-        return self._string.read(1)
-      else:
-        if key >= (self._end - self._start):
-          raise IndexError()
-        self._string.seek(self._start+key)
-        return self._string.read(1)
-    elif type(key) == slice:
-      if key.stop == None:
-        end = self._end
-      elif key.stop < 0:
-        end = self._end+key.stop
-      else:
-        end = self._start+key.stop
-      start = self._start+(key.start or 0)
-      return StringView(self._string, start=start, end=end)
-    else:
-      raise IndexError()
-
-  def __str__(self):
-    self._string.seek(self._start)
-    return self._string.read(self._end-self._start)
-
-  def __nonzero__(self):
-    return len(self)
+def _decode_in_session(substrate, specClass, session):
+    '''
+    Decodes substrate using spec template of specClass. If session (parse
+    session of the x509 package) is given, it is active during decoding and
+    its templates are used.
+    '''
+    if session is None:
+        return decode(as_substrate(substrate), asn1Spec=templates.get(specClass))
+    with session:
+        return decode(as_substrate(substrate), asn1Spec=session.templates.get(specClass))
 
 
-def decode_msg(message):    
+def decode_msg(message, session=None):
     '''
     Decodes message in DER encoding.
+    Message may be str, bytearray, mmap, memoryview or buffer.
     Returns ASN1 message object
     '''
-    # create template for decoder
-    msg = Message()
     # decode pkcs signed message
-    mess_obj = StringIO(message)
-    mess_view = StringView(mess_obj, 0, len(message))
-    decoded = decode(mess_view, asn1Spec=msg)
+    decoded = _decode_in_session(message, Message, session)
     message = decoded[0]
     return message
 
 
-def decode_qts(qts_bytes):
+def decode_qts(qts_bytes, session=None):
     '''
     Decodes qualified timestamp
     '''
-    qts = Qts()    
-    decoded = decode(qts_bytes,asn1Spec=qts)
+    decoded = _decode_in_session(qts_bytes, Qts, session)
     qts = decoded[0]
-    
+
     return qts
 
 
-def decode_tst(tst_bytes):
+def decode_tst(tst_bytes, session=None):
     '''
     Decodes Timestamp Token
     '''
-    tst = TSTInfo()
-    decoded = decode(tst_bytes,asn1Spec=tst)
+    decoded = _decode_in_session(tst_bytes, TSTInfo, session)
     tst = decoded[0]
-    
-    return tst
 
+    return tst
 
 
-    
-    
-    
- 
+templates.register(Message, Qts, TSTInfo)
@@ -38,10 +38,11 @@ import pkcs7_decoder
 import verifier
 
 
-def parse_qts(dmQTimestamp, verify=False):
+def parse_qts(dmQTimestamp, verify=False, keep_asn1=False):
     '''
     Parses QTimestamp and verifies it.
     Returns result of verification and TimeStampTOken instance.
+    The decoded certificates are kept in the token only if keep_asn1 is set.
     '''    
     ts = base64.b64decode(dmQTimestamp)
     
@@ -60,7 +61,7 @@ def parse_qts(dmQTimestamp, verify=False):
     tstData = qts.getComponentByName("content").getComponentByName("encapsulatedContentInfo").getComponentByName("eContent")._value    
     tstinfo = pkcs7_decoder.decode_tst(tstData)
     
-    t = models.TimeStampToken(tstinfo)
+    t = models.TimeStampToken(tstinfo, keep_asn1)
     
     certificates = qts.getComponentByName("content").getComponentByName("certificates")
     # get the signer info and attach signing certificates to the TSTinfo
@@ -73,6 +74,6 @@ def parse_qts(dmQTimestamp, verify=False):
         logger.error("No certificate found for timestamp signer")
         continue           
       
-      t.asn1_certificates.append(cert)
+      t.add_certificate(cert)
 
     return verif_result, t
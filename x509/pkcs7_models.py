@@ -21,11 +21,17 @@ Created on Dec 11, 2009
 
 '''
 import base64
+import calendar
+import copy
 import datetime
+import hashlib
 import time
+from collections import namedtuple
 
 
 from pyasn1.error import PyAsn1Error
+from pyasn1.type import univ
+from pyasn1.codec.der import encoder
 from pkcs7.asn1_models.tools import *
 from pkcs7.asn1_models.oid import *
 from pkcs7.asn1_models.tools import *
@@ -33,19 +39,152 @@ from pkcs7.asn1_models.X509_certificate import *
 from pkcs7.asn1_models.certificate_extensions import *
 from pkcs7.debug import *
 from pkcs7.asn1_models.decoder_workarounds import decode
+from pkcs7.asn1_models.oid_registry import registry as oidRegistry
+from pkcs7.der_index import read_tlv
+from parse_session import current_session
 
 
 class CertificateError(Exception):
     pass
 
 
-class Name(object):
+class FieldNotParsedError(CertificateError, AttributeError):
+    '''
+    Raised on access to a field that was not requested when the certificate
+    was parsed with x509_parse(fields=...).
+    '''
+    pass
+
+
+class CrlNotAvailableError(CertificateError):
+    '''
+    Raised when no CRL of the issuer of a certificate is available, so its
+    revocation status is unknown.
+    '''
+    pass
+
+
+class SlottedObject(object):
+    '''
+    Base of the models. They keep their attributes in __slots__; this class
+    makes them picklable with all pickle protocols (unset slots are skipped).
+    '''
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name.startswith("__") and not name.endswith("__"):
+                    name = "_%s%s" % (cls.__name__.lstrip("_"), name)
+                try:
+                    state[name] = getattr(self, name)
+                except AttributeError:
+                    pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+
+class SharedObject(SlottedObject):
+    '''
+    Base of the models whose instances the caches of the parse session share
+    among certificates (names, public keys, extension values). freeze() is
+    called on them before they are shared; assigning or deleting public
+    attributes of a frozen instance raises AttributeError, so one caller can
+    not change what the others see. Copies made by pickling are not frozen.
+    '''
+    __slots__ = ("_frozen",)
+
+    def __setattr__(self, name, value):
+        if not name.startswith("_") and getattr(self, "_frozen", False):
+            raise AttributeError("%s is shared and read-only" % type(self).__name__)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if not name.startswith("_") and getattr(self, "_frozen", False):
+            raise AttributeError("%s is shared and read-only" % type(self).__name__)
+        object.__delattr__(self, name)
+
+    def __getstate__(self):
+        state = SlottedObject.__getstate__(self)
+        state.pop("_frozen", None)
+        return state
+
+    def freeze(self):
+        '''
+        Makes this instance and shared instances in its attributes (directly
+        or in tuples) read-only. Returns self.
+        '''
+        object.__setattr__(self, "_frozen", True)
+        for value in self.__getstate__().itervalues():
+            _freeze(value)
+        return self
+
+
+def _freeze(value):
+    '''
+    Freezes value if it is SharedObject or tuple of them (see
+    SharedObject.freeze). Returns value.
+    '''
+    if isinstance(value, SharedObject):
+        if not getattr(value, "_frozen", False):
+            value.freeze()
+    elif isinstance(value, tuple):
+        for item in value:
+            _freeze(item)
+    return value
+
+
+def _plain_value(asn1Value):
+    '''
+    Converts decoded ASN1 value to plain Python value, so that the decoded
+    tree is not kept alive by it: dotted string for OIDs, number for
+    integers, str for octet and character strings and DER encoding for
+    anything else.
+    '''
+    if isinstance(asn1Value, univ.ObjectIdentifier):
+        return tuple_to_OID(asn1Value)
+    if isinstance(asn1Value, univ.Integer):
+        return asn1Value._value
+    if isinstance(asn1Value, univ.OctetString):
+        return str(asn1Value)
+    return encoder.encode(asn1Value)
+
+
+def _add_flag_properties(cls, names):
+    '''
+    Adds read-only boolean property for each of names to cls, backed by bit
+    (1 << position in names) of the integer cls._flags.
+    '''
+    for bit, name in enumerate(names):
+        mask = 1 << bit
+        setattr(cls, name, property(lambda self, mask=mask: bool(self._flags & mask)))
+
+
+def _bits_to_flags(bits, count):
+    '''
+    Returns integer with bit i set if bit i of the ASN1 bit string is set
+    (for i < count).
+    '''
+    flags = 0
+    for bit in xrange(min(len(bits), count)):
+        if bits[bit]:
+            flags |= 1 << bit
+    return flags
+
+
+class Name(SharedObject):
     '''
     Represents Name (structured, tagged).
     This is a dictionary. Keys are types of names (mapped from OID to name if
     known, see _oid2Name below, otherwise numeric). Values are arrays containing
     the names that mapped to given type (because having more values of one type,
     e.g. multiple CNs is common).
+    Names compare equal if their canonical_key() is equal and can be used as
+    dictionary keys, e.g. to match issuers to subjects.
     '''
     _oid2Name = {
         "2.5.4.3": "CN",
@@ -78,46 +217,126 @@ class Name(object):
         "0.9.2342.19200300.100.1.1": "Userid",
     }
 
+    __slots__ = ("__attributes", "__string", "__key", "__hash", "__digest")
+
     def __init__(self, name):
-        self.__attributes = {}
+        attributes = {}
         for name_part in name:
             for attr in name_part:
                 type = str(attr.getComponentByPosition(0).getComponentByName('type'))
-                value = str(attr.getComponentByPosition(0).getComponentByName('value'))
+                value = intern(str(attr.getComponentByPosition(0).getComponentByName('value')))
 
                 #use numeric OID form only if mapping is not known
-                typeStr = Name._oid2Name.get(type) or type
-                values = self.__attributes.get(typeStr)
+                typeStr = Name._oid2Name.get(type) or intern(type)
+                values = attributes.get(typeStr)
                 if values is None:
-                    self.__attributes[typeStr] = [value]
+                    attributes[typeStr] = [value]
                 else:
                     values.append(value)
+        self.__attributes = dict((key, tuple(values)) for (key, values) in attributes.iteritems())
+        self.__string = None
+        self.__key = None
+        self.__hash = None
+        self.__digest = None
+
+    @classmethod
+    def from_asn1(cls, name):
+        '''
+        Returns Name for ASN1 name (Name choice or a sequence holding the
+        RDNSequence). Names of the same encoding are decoded only once and
+        the instance is shared, so it is frozen (see SharedObject).
+        '''
+        key = None
+        if name is not None:
+            key = getattr(name.getComponentByPosition(0), "_substrate", None)
+        if key is None:
+            return cls(name)
+        cache = current_session().name_cache
+        result = cache.get(key)
+        if result is None:
+            result = cls(name).freeze()
+            cache.put(key, result)
+        return result
 
     def __str__(self):
         ''' Returns the Distinguished name as string. The string for the same
         set of attributes is always the same.
         '''
-        #There is no consensus whether RDNs in DN are ordered or not, this way
-        #we will have all sets having same components mapped to identical string.
-        valueStrings = []
-        for key in sorted(self.__attributes.keys()):
-            values = sorted(self.__attributes.get(key))
-            valuesStr = ", ".join(["%s=%s" % (key, value) for value in values])
-            valueStrings.append(valuesStr)
+        if self.__string is None:
+            #There is no consensus whether RDNs in DN are ordered or not, this way
+            #we will have all sets having same components mapped to identical string.
+            valueStrings = []
+            for key in sorted(self.__attributes.keys()):
+                values = sorted(self.__attributes.get(key))
+                valuesStr = ", ".join(["%s=%s" % (key, value) for value in values])
+                valueStrings.append(valuesStr)
+            self.__string = ", ".join(valueStrings)
+
+        return self.__string
 
-        return ", ".join(valueStrings)
+    @staticmethod
+    def _normalize_value(value):
+        '''
+        Case folds value and collapses its whitespace (insignificant space
+        handling of RFC 4518, as required by RFC 5280 section 7.1).
+        '''
+        try:
+            value = value.decode("utf-8")
+        except UnicodeDecodeError:
+            value = value.decode("latin-1")
+        return u" ".join(value.lower().split())
+
+    def canonical_key(self):
+        '''
+        Returns normalized form of the name used for comparison: values are
+        case folded with collapsed whitespace and neither order of the
+        attributes nor order of values matters.
+        '''
+        if self.__key is None:
+            self.__key = tuple(sorted(
+                (key, tuple(sorted(Name._normalize_value(value) for value in values)))
+                for (key, values) in self.__attributes.iteritems()))
+        return self.__key
+
+    def digest(self):
+        '''
+        Returns SHA-1 of the canonical_key(), a compact (20 bytes) key of
+        the name, e.g. to match issuers to subjects without keeping Names.
+        '''
+        if self.__digest is None:
+            self.__digest = hashlib.sha1(repr(self.canonical_key())).digest()
+        return self.__digest
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Name):
+            return NotImplemented
+        return hash(self) == hash(other) and self.canonical_key() == other.canonical_key()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        if self.__hash is None:
+            self.__hash = hash(self.canonical_key())
+        return self.__hash
 
     def get_attributes(self):
-        return self.__attributes.copy()
+        return dict((key, list(values)) for (key, values) in self.__attributes.iteritems())
 
 
-class ValidityInterval(object):
+class ValidityInterval(SlottedObject):
     '''
     Validity interval of a certificate. Values are UTC times.
     Attributes:
     -valid_from
     -valid_to
     '''
+    __slots__ = ("valid_from", "valid_to")
 
     def __init__(self, validity):
         self.valid_from = self._getGeneralizedTime(
@@ -176,7 +395,7 @@ class ValidityInterval(object):
         return datetime.datetime(year, month, day, hour, minute, second)
 
 
-class PublicKeyInfo(object):
+class PublicKeyInfo(SharedObject):
     '''
     Represents information about public key.
     Expects RSA or DSA.
@@ -185,11 +404,35 @@ class PublicKeyInfo(object):
     - key (dict of parameter name to value; keys "mod", "exp" for RSA and
         "pub", "p", "q", "g" for DSA)
     - algType - one of the RSA, DSA "enum" below
+    Instances made by from_asn1() are shared by all certificates with the
+    same key, so they are frozen (see SharedObject) and the key dictionary
+    must not be modified.
     '''
+    __slots__ = ("alg", "key", "algType", "algName")
+
     UNKNOWN = -1
     RSA = 0
     DSA = 1
 
+    @classmethod
+    def from_asn1(cls, public_key_info):
+        '''
+        Returns PublicKeyInfo for ASN1 SubjectPublicKeyInfo, the key
+        material of the same key is decoded only once.
+        '''
+        algorithm = public_key_info.getComponentByName("algorithm")
+        parameters = algorithm.getComponentByName("parameters")
+        if parameters is not None:
+            parameters = str(parameters)
+        key = (str(algorithm), parameters,
+               public_key_info.getComponentByName("subjectPublicKey").toContentOctets())
+        cache = current_session().key_cache
+        result = cache.get(key)
+        if result is None:
+            result = cls(public_key_info).freeze()
+            cache.put(key, result)
+        return result
+
     def __init__(self, public_key_info):
         algorithm = public_key_info.getComponentByName("algorithm")
         parameters = algorithm.getComponentByName("parameters")
@@ -198,11 +441,14 @@ class PublicKeyInfo(object):
         bitstr_key = public_key_info.getComponentByName("subjectPublicKey")
 
         if self.alg == "1.2.840.113549.1.1.1":
-            self.key = get_RSA_pub_key_material(bitstr_key)
+            self.key = get_RSA_pub_key_material(bitstr_key, current_session().templates)
             self.algType = PublicKeyInfo.RSA
             self.algName = "RSA"
         elif self.alg == "1.2.840.10040.4.1":
-            self.key = get_DSA_pub_key_material(bitstr_key, parameters)
+            session = current_session()
+            self.key = get_DSA_pub_key_material(bitstr_key, parameters,
+                                                session.dss_params_cache,
+                                                session.templates)
             self.algType = PublicKeyInfo.DSA
             self.algName = "DSA"
         else:
@@ -211,39 +457,51 @@ class PublicKeyInfo(object):
             self.algName = self.alg
 
 
-class SubjectAltNameExt(object):
+def general_names_to_items(asn1_generalNames):
+    '''
+    Returns tuple of (type, value) tuples for GeneralNames.
+    '''
+    items = []
+    for gname in asn1_generalNames:
+        for pos, key in (
+                (0, 'otherName'),
+                (1, 'email'),
+                (2, 'DNS'),
+                (3, 'x400Address'),
+                (4, 'dirName'),
+                (5, 'ediPartyName'),
+                (6, 'URI'),
+                (7, 'IP'),
+                (8, 'RegisteredID')):
+            comp = gname.getComponentByPosition(pos)
+            if comp:
+                if pos in (0, 3, 5):  # May be wrong
+                    value = Name(comp)
+                elif pos == 4:
+                    value = Name(comp)
+                else:
+                    value = str(comp)
+                items.append((key, value))
+    return tuple(items)
+
+
+class SubjectAltNameExt(SharedObject):
     '''
     Subject alternative name extension.
     '''
+    __slots__ = ("items",)
+
     def __init__(self, asn1_subjectAltName):
         """Parse SubjectAltname"""
-        self.items = []
-        for gname in asn1_subjectAltName:
-            for pos, key in (
-                    (0, 'otherName'),
-                    (1, 'email'),
-                    (2, 'DNS'),
-                    (3, 'x400Address'),
-                    (4, 'dirName'),
-                    (5, 'ediPartyName'),
-                    (6, 'URI'),
-                    (7, 'IP'),
-                    (8, 'RegisteredID')):
-                comp = gname.getComponentByPosition(pos)
-                if comp:
-                    if pos in (0, 3, 5):  # May be wrong
-                        value = Name(comp)
-                    elif pos == 4:
-                        value = Name(comp)
-                    else:
-                        value = str(comp)
-                    self.items.append((key, value))
-
-
-class BasicConstraintsExt(object):
+        self.items = general_names_to_items(asn1_subjectAltName)
+
+
+class BasicConstraintsExt(SharedObject):
     '''
     Basic constraints of this certificate - is it CA and maximal chain depth.
     '''
+    __slots__ = ("ca", "max_path_len")
+
     def __init__(self, asn1_bConstraints):
         self.ca = bool(asn1_bConstraints.getComponentByName("ca")._value)
         self.max_path_len = None
@@ -251,50 +509,39 @@ class BasicConstraintsExt(object):
             self.max_path_len = asn1_bConstraints.getComponentByName("pathLen")._value
 
 
-class KeyUsageExt(object):
+class KeyUsageExt(SharedObject):
     '''
     Key usage extension.
+    The flags are kept as bits of one integer (_flags) and read through
+    boolean properties named after them.
     '''
+    __slots__ = ("_flags",)
+
+    _flagNames = (
+        "digitalSignature",     # (0),
+        "nonRepudiation",       # (1),
+        "keyEncipherment",      # (2),
+        "dataEncipherment",     # (3),
+        "keyAgreement",         # (4),
+        "keyCertSign",          # (5),
+        "cRLSign",              # (6),
+        "encipherOnly",         # (7),
+        "decipherOnly",         # (8)
+    )
+
     def __init__(self, asn1_keyUsage):
-        self.digitalSignature = False    # (0),
-        self.nonRepudiation = False     # (1),
-        self.keyEncipherment = False    # (2),
-        self.dataEncipherment = False   # (3),
-        self.keyAgreement = False       # (4),
-        self.keyCertSign = False        # (5),
-        self.cRLSign = False            # (6),
-        self.encipherOnly = False       # (7),
-        self.decipherOnly = False       # (8)
-
-        bits = asn1_keyUsage._value
-        try:
-            if (bits[0]):
-                self.digitalSignature = True
-            if (bits[1]):
-                self.nonRepudiation = True
-            if (bits[2]):
-                self.keyEncipherment = True
-            if (bits[3]):
-                self.dataEncipherment = True
-            if (bits[4]):
-                self.keyAgreement = True
-            if (bits[5]):
-                self.keyCertSign = True
-            if (bits[6]):
-                self.cRLSign = True
-            if (bits[7]):
-                self.encipherOnly = True
-            if (bits[8]):
-                self.decipherOnly = True
-        except IndexError:
-            return
+        self._flags = _bits_to_flags(asn1_keyUsage, len(KeyUsageExt._flagNames))
+
+_add_flag_properties(KeyUsageExt, KeyUsageExt._flagNames)
 
 
-class ExtendedKeyUsageExt(object):
+class ExtendedKeyUsageExt(SharedObject):
     '''
     Extended key usage extension.
     '''
-    #The values of the _keyPurposeAttrs dict will be set to True/False as
+    __slots__ = ("_flags",)
+
+    #The values of the _keyPurposeAttrs dict are readable as True/False
     #attributes of this objects depending on whether the extKeyUsage lists them.
     _keyPurposeAttrs = {
         "1.3.6.1.5.5.7.3.1": "serverAuth",
@@ -306,19 +553,26 @@ class ExtendedKeyUsageExt(object):
         "1.3.6.1.5.5.7.3.7": "ipsecUser",
         "1.3.6.1.5.5.7.3.8": "timeStamping",
     }
+    #OID -> bit in _flags
+    _keyPurposeBits = dict((oid, 1 << bit) for (bit, oid) in enumerate(sorted(_keyPurposeAttrs)))
 
     def __init__(self, asn1_extKeyUsage):
-        usageOIDs = set([tuple_to_OID(usageOID) for usageOID in asn1_extKeyUsage])
+        flags = 0
+        for usageOID in asn1_extKeyUsage:
+            flags |= ExtendedKeyUsageExt._keyPurposeBits.get(tuple_to_OID(usageOID), 0)
+        self._flags = flags
 
-        for (oid, attr) in ExtendedKeyUsageExt._keyPurposeAttrs.items():
-            setattr(self, attr, oid in usageOIDs)
+_add_flag_properties(ExtendedKeyUsageExt,
+    [ExtendedKeyUsageExt._keyPurposeAttrs[oid] for oid in sorted(ExtendedKeyUsageExt._keyPurposeAttrs)])
 
 
-class AuthorityKeyIdExt(object):
+class AuthorityKeyIdExt(SharedObject):
     '''
     Authority Key identifier extension.
     Identifies key of the authority which was used to sign this certificate.
     '''
+    __slots__ = ("key_id", "auth_cert_sn", "auth_cert_issuer")
+
     def __init__(self, asn1_authKeyId):
         if (asn1_authKeyId.getComponentByName("keyIdentifier")) is not None:
             self.key_id = asn1_authKeyId.getComponentByName("keyIdentifier")._value
@@ -330,19 +584,23 @@ class AuthorityKeyIdExt(object):
             self.auth_cert_issuer = iss
 
 
-class SubjectKeyIdExt(object):
+class SubjectKeyIdExt(SharedObject):
     '''
     Subject Key Identifier extension. Just the octet string.
     '''
+    __slots__ = ("subject_key_id",)
+
     def __init__(self, asn1_subKey):
         self.subject_key_id = asn1_subKey._value
 
 
-class PolicyQualifier(object):
+class PolicyQualifier(SharedObject):
     '''
     Certificate policy qualifier. Consist of id and
     own qualifier (id-qt-cps | id-qt-unotice).
     '''
+    __slots__ = ("id", "qualifier")
+
     def __init__(self, asn1_pQual):
         self.id = tuple_to_OID(asn1_pQual.getComponentByName("policyQualifierId"))
         if asn1_pQual.getComponentByName("qualifier") is not None:
@@ -359,7 +617,7 @@ class PolicyQualifier(object):
             #    self.qualifier = comp
 
 
-class AuthorityInfoAccessExt(object):
+class AuthorityInfoAccessExt(SharedObject):
     '''
     Authority information access.
     Instance variables:
@@ -367,6 +625,8 @@ class AuthorityInfoAccessExt(object):
     - access_location as string
     - access_method as string if the OID is known (None otherwise)
     '''
+    __slots__ = ("id", "access_location", "access_method")
+
     _accessMethods = {
         "1.3.6.1.5.5.7.48.1": "ocsp",
         "1.3.6.1.5.5.7.48.2": "caIssuers",
@@ -379,62 +639,53 @@ class AuthorityInfoAccessExt(object):
         pass
 
 
-class CertificatePolicyExt(object):
+class CertificatePolicyExt(SharedObject):
     '''
     Certificate policy extension.
     COnsist of id and qualifiers.
     '''
+    __slots__ = ("id", "qualifiers")
+
     def __init__(self, asn1_certPol):
         self.id = tuple_to_OID(asn1_certPol.getComponentByName("policyIdentifier"))
-        self.qualifiers = []
+        self.qualifiers = ()
         if (asn1_certPol.getComponentByName("policyQualifiers")):
             qualifiers = asn1_certPol.getComponentByName("policyQualifiers")
-            self.qualifiers = [PolicyQualifier(pq) for pq in qualifiers]
+            self.qualifiers = tuple(PolicyQualifier(pq) for pq in qualifiers)
 
 
-class Reasons(object):
+class Reasons(SharedObject):
     '''
     CRL distribution point reason flags
+    The flags are kept as bits of one integer (_flags) and read through
+    boolean properties named after them.
     '''
+    __slots__ = ("_flags",)
+
+    _flagNames = (
+        "unused",               # (0),
+        "keyCompromise",        # (1),
+        "cACompromise",         # (2),
+        "affiliationChanged",   # (3),
+        "superseded",           # (4),
+        "cessationOfOperation", # (5),
+        "certificateHold",      # (6),
+        "privilegeWithdrawn",   # (7),
+        "aACompromise",         # (8)
+    )
+
     def __init__(self, asn1_rflags):
-        self.unused  = False   # (0),
-        self.keyCompromise = False   # (1),
-        self.cACompromise = False   # (2),
-        self.affiliationChanged = False    # (3),
-        self.superseded = False   # (4),
-        self.cessationOfOperation = False   # (5),
-        self.certificateHold = False   # (6),
-        self.privilegeWithdrawn = False   # (7),
-        self.aACompromise = False   # (8)
-
-        bits = asn1_rflags._value
-        try:
-            if (bits[0]):
-                self.unused = True
-            if (bits[1]):
-                self.keyCompromise = True
-            if (bits[2]):
-                self.cACompromise = True
-            if (bits[3]):
-                self.affiliationChanged = True
-            if (bits[4]):
-                self.superseded = True
-            if (bits[5]):
-                self.cessationOfOperation = True
-            if (bits[6]):
-                self.certificateHold = True
-            if (bits[7]):
-                self.privilegeWithdrawn = True
-            if (bits[8]):
-                self.aACompromise = True
-        except IndexError:
-            return
+        self._flags = _bits_to_flags(asn1_rflags, len(Reasons._flagNames))
+
+_add_flag_properties(Reasons, Reasons._flagNames)
 
 
-class CRLdistPointExt(object):
+class CRLdistPointExt(SharedObject):
     '''
     CRL distribution point extension
     '''
+    __slots__ = ("dist_point", "reasons", "issuer")
+
     def __init__(self, asn1_crl_dp):
         dp = asn1_crl_dp.getComponentByName("distPoint")
         if dp is not None:
@@ -454,10 +705,12 @@ class CRLdistPointExt(object):
             self.issuer = None
 
 
-class QcStatementExt(object):
+class QcStatementExt(SharedObject):
     '''
     id_pe_qCStatement
     '''
+    __slots__ = ("oid", "statementInfo")
+
     def __init__(self, asn1_caStatement):
         self.oid = str(asn1_caStatement.getComponentByName("stmtId"))
         self.statementInfo = asn1_caStatement.getComponentByName("stmtInfo")
@@ -465,7 +718,9 @@ class QcStatementExt(object):
             self.statementInfo = str(self.statementInfo)
 
 
-class PolicyConstraintsExt(object):
+class PolicyConstraintsExt(SharedObject):
+    __slots__ = ("requireExplicitPolicy", "inhibitPolicyMapping")
+
     def __init__(self, asn1_policyConstraints):
         self.requireExplicitPolicy = None
         self.inhibitPolicyMapping = None
@@ -480,7 +735,9 @@ class PolicyConstraintsExt(object):
             self.inhibitPolicyMapping = inhibitPolicyMapping._value
 
 
-class NameConstraint(object):
+class NameConstraint(SharedObject):
+    __slots__ = ("base", "minimum", "maximum")
+
     def __init__(self, base, minimum, maximum):
         self.base = base
         self.minimum = minimum
@@ -493,11 +750,10 @@ class NameConstraint(object):
         return self.__repr__()
 
 
-class NameConstraintsExt(object):
-    def __init__(self, asn1_nameConstraints):
-        self.permittedSubtrees = []
-        self.excludedSubtrees = []
+class NameConstraintsExt(SharedObject):
+    __slots__ = ("permittedSubtrees", "excludedSubtrees")
 
+    def __init__(self, asn1_nameConstraints):
         permittedSubtrees = asn1_nameConstraints.getComponentByName("permittedSubtrees")
         excludedSubtrees = asn1_nameConstraints.getComponentByName("excludedSubtrees")
 
@@ -506,7 +762,7 @@ class NameConstraintsExt(object):
 
     def _parseSubtree(self, asn1Subtree):
         if asn1Subtree is None:
-            return []
+            return ()
 
         subtreeList = []
 
@@ -525,35 +781,45 @@ class NameConstraintsExt(object):
 
             subtreeList.append(NameConstraint(base, minimum, maximum))
 
-        return subtreeList
+        return tuple(subtreeList)
+
 
+class NetscapeCertTypeExt(SharedObject):
+    __slots__ = ("clientCert", "serverCert", "caCert")
 
-class NetscapeCertTypeExt(object):
     def __init__(self, asn1_netscapeCertType):
         #https://www.mozilla.org/projects/security/pki/nss/tech-notes/tn3.html
-        bits = asn1_netscapeCertType._value
+        bits = asn1_netscapeCertType
         self.clientCert = len(bits) > 0 and bool(bits[0])
         self.serverCert = len(bits) > 1 and bool(bits[1])
         self.caCert = len(bits) > 5 and bool(bits[5])
 
 
 
-class AppleSubmissionCertificateExt(object):
+class AppleSubmissionCertificateExt(SharedObject):
+    __slots__ = ()
+
     def __init__(self, asn1_type):
         pass
 
 
-class AppleDevelopmentCertificateExt(object):
+class AppleDevelopmentCertificateExt(SharedObject):
+    __slots__ = ()
+
     def __init__(self, asn1_type):
         pass
 
 
-class MacApplicationSoftwareDevelopmentSigning(object):
+class MacApplicationSoftwareDevelopmentSigning(SharedObject):
+    __slots__ = ()
+
     def __init__(self, asn1_type):
         pass
 
 
-class MacApplicationSoftwareSubmissionSigning(object):
+class MacApplicationSoftwareSubmissionSigning(SharedObject):
+    __slots__ = ()
+
     def __init__(self, asn1_type):
         pass
 
@@ -584,29 +850,41 @@ class ExtensionTypes(object):
     knownExtensions = [name for (attr, name) in vars(ExtensionType).items() if attr.isupper()]
 
 
-class Extension(object):
+class Extension(SlottedObject):
     '''
     Represents one Extension in X509v3 certificate
     Attributes:
     - id  (identifier of extension)
     - is_critical
     - value (value of extension, needs more parsing - it is in DER encoding)
+    - ext_type (ExtensionType of the extension if it was parsed, else None)
+    If lazy is set, value of a non-critical known extension is kept in DER
+    and parsed on first access of value or ext_type, in the parse session
+    that was active when the extension was created.
+    Parsed values of known extensions are shared by all extensions with the
+    same OID and encoding (see ParseSession.extension_cache), so they are
+    read-only (see SharedObject); all collections in them (lists of values,
+    SAN items, policy qualifiers, name constraint subtrees) are tuples.
     '''
-    #OID: (ASN1Spec, valueConversionFunction, attributeName)
+    __slots__ = ("id", "is_critical", "_value", "_decoded", "_ext_type", "_declared_type",
+                 "_session")
+
+    #OID: (ASN1Spec class, valueConversionFunction, attributeName); the spec
+    #template is taken from the templates of the active session
     _extensionDecoders = {
-        "2.5.29.17": (GeneralNames(),                 lambda v: SubjectAltNameExt(v),                 ExtensionType.SUBJ_ALT_NAME),
-        "2.5.29.35": (KeyId(),                        lambda v: AuthorityKeyIdExt(v),                 ExtensionType.AUTH_KEY_ID),
-        "2.5.29.14": (SubjectKeyId(),                 lambda v: SubjectKeyIdExt(v),                   ExtensionType.SUBJ_KEY_ID),
-        "2.5.29.19": (BasicConstraints(),             lambda v: BasicConstraintsExt(v),               ExtensionType.BASIC_CONSTRAINTS),
-        "2.5.29.15": (None,                           lambda v: KeyUsageExt(v),                       ExtensionType.KEY_USAGE),
-        "2.5.29.32": (CertificatePolicies(),          lambda v: [CertificatePolicyExt(p) for p in v], ExtensionType.CERT_POLICIES),
-        "2.5.29.31": (CRLDistributionPoints(),        lambda v: [CRLdistPointExt(p) for p in v],      ExtensionType.CRL_DIST_POINTS),
-        "1.3.6.1.5.5.7.1.3": (Statements(),           lambda v: [QcStatementExt(s) for s in v],       ExtensionType.STATEMENTS),
-        "1.3.6.1.5.5.7.1.1": (AuthorityInfoAccess(),  lambda v: [AuthorityInfoAccessExt(s) for s in v], ExtensionType.AUTH_INFO_ACCESS),
-        "2.5.29.37": (ExtendedKeyUsage(),             lambda v: ExtendedKeyUsageExt(v),               ExtensionType.EXT_KEY_USAGE),
-        "2.5.29.36": (PolicyConstraints(),            lambda v: PolicyConstraintsExt(v),              ExtensionType.POLICY_CONSTRAINTS),
-        "2.5.29.30": (NameConstraints(),              lambda v: NameConstraintsExt(v),                ExtensionType.NAME_CONSTRAINTS),
-        "2.16.840.1.113730.1.1": (NetscapeCertType(), lambda v: NetscapeCertTypeExt(v),               ExtensionType.NETSCAPE_CERT_TYPE),
+        "2.5.29.17": (GeneralNames,            lambda v: SubjectAltNameExt(v),                 ExtensionType.SUBJ_ALT_NAME),
+        "2.5.29.35": (KeyId,                   lambda v: AuthorityKeyIdExt(v),                 ExtensionType.AUTH_KEY_ID),
+        "2.5.29.14": (SubjectKeyId,            lambda v: SubjectKeyIdExt(v),                   ExtensionType.SUBJ_KEY_ID),
+        "2.5.29.19": (BasicConstraints,        lambda v: BasicConstraintsExt(v),               ExtensionType.BASIC_CONSTRAINTS),
+        "2.5.29.15": (KeyUsage,                lambda v: KeyUsageExt(v),                       ExtensionType.KEY_USAGE),
+        "2.5.29.32": (CertificatePolicies,     lambda v: tuple(CertificatePolicyExt(p) for p in v), ExtensionType.CERT_POLICIES),
+        "2.5.29.31": (CRLDistributionPoints,   lambda v: tuple(CRLdistPointExt(p) for p in v), ExtensionType.CRL_DIST_POINTS),
+        "1.3.6.1.5.5.7.1.3": (Statements,      lambda v: tuple(QcStatementExt(s) for s in v), ExtensionType.STATEMENTS),
+        "1.3.6.1.5.5.7.1.1": (AuthorityInfoAccess, lambda v: tuple(AuthorityInfoAccessExt(s) for s in v), ExtensionType.AUTH_INFO_ACCESS),
+        "2.5.29.37": (ExtendedKeyUsage,        lambda v: ExtendedKeyUsageExt(v),               ExtensionType.EXT_KEY_USAGE),
+        "2.5.29.36": (PolicyConstraints,       lambda v: PolicyConstraintsExt(v),              ExtensionType.POLICY_CONSTRAINTS),
+        "2.5.29.30": (NameConstraints,         lambda v: NameConstraintsExt(v),                ExtensionType.NAME_CONSTRAINTS),
+        "2.16.840.1.113730.1.1": (NetscapeCertType, lambda v: NetscapeCertTypeExt(v),               ExtensionType.NETSCAPE_CERT_TYPE),
         # From https://images.apple.com/certificateauthority/pdf/Apple_WWDR_CPS_v1.17.pdf
         "1.2.840.113635.100.6.1.4": (None,            lambda v: AppleSubmissionCertificateExt(v),     ExtensionType.APPLE_SUBMISSION_CERTIFICATE),
         "1.2.840.113635.100.6.1.2": (None,            lambda v: AppleDevelopmentCertificateExt(v),     ExtensionType.APPLE_DEVELOPMENT_CERTIFICATE),
@@ -614,33 +892,83 @@ class Extension(object):
         "1.2.840.113635.100.6.1.7": (None,            lambda v: MacApplicationSoftwareSubmissionSigning(v),      ExtensionType.MAC_APPLICATION_SOFTWARE_SUBMISSION_SIGNING),
     }
 
-    def __init__(self, extension):
+    def __init__(self, extension, lazy=False):
         self.id = tuple_to_OID(extension.getComponentByName("extnID"))
         critical = extension.getComponentByName("critical")
         self.is_critical = (critical != 0)
-        self.ext_type = None
+        self._ext_type = None
+        self._session = None
 
         # set the bytes as the extension value
-        self.value = extension.getComponentByName("extnValue")._value
+        self._value = extension.getComponentByName("extnValue")._value
+        self._decoded = True
 
-        # if we know the type of value, parse it
+        # if we know the type of value, parse it (now, or on first access
+        # in lazy mode)
         decoderTuple = Extension._extensionDecoders.get(self.id)
         if decoderTuple is not None:
-            try:
-                (decoderAsn1Spec, decoderFunction, extType) = decoderTuple
-                v = decode(self.value, asn1Spec=decoderAsn1Spec)[0]
-                self.value = decoderFunction(v)
-                self.ext_type = extType
-            except PyAsn1Error:
-                #According to RFC 5280, unrecognized extension can be ignored
-                #unless marked critical, though it doesn't cover all cases.
-                if self.is_critical:
-                    raise
+            self._declared_type = decoderTuple[2]
+            #critical extensions are always decoded right away, so that
+            #malformed ones are refused the same way in lazy mode
+            if lazy and not self.is_critical:
+                self._decoded = False
+                self._session = current_session()
+            else:
+                self._decode()
         elif self.is_critical:
             raise CertificateError("Critical extension OID %s not understood" % self.id)
-
-
-class Certificate(object):
+        else:
+            self._declared_type = None
+
+    def __getstate__(self):
+        # the session is not pickled, value pending decoding is decoded in
+        # the session active when it is first accessed then
+        state = SlottedObject.__getstate__(self)
+        state["_session"] = None
+        return state
+
+    def _decode(self):
+        session = self._session
+        if session is not None:
+            self._session = None
+            with session:
+                return self._decode()
+        self._decoded = True
+        (decoderSpecClass, decoderFunction, extType) = Extension._extensionDecoders[self.id]
+        session = current_session()
+        cache = session.extension_cache
+        key = (self.id, self._value)
+        value = cache.get(key)
+        if value is not None:
+            self._value = value
+            self._ext_type = extType
+            return
+        try:
+            v = decode(self._value, asn1Spec=session.templates.get(decoderSpecClass))[0]
+            value = _freeze(decoderFunction(v))
+            cache.put(key, value)
+            self._value = value
+            self._ext_type = extType
+        except PyAsn1Error:
+            #According to RFC 5280, unrecognized extension can be ignored
+            #unless marked critical, though it doesn't cover all cases.
+            if self.is_critical:
+                raise
+
+    @property
+    def value(self):
+        if not self._decoded:
+            self._decode()
+        return self._value
+
+    @property
+    def ext_type(self):
+        if not self._decoded:
+            self._decode()
+        return self._ext_type
+
+
+class Certificate(SlottedObject):
     '''
     Represents Certificate object.
     Attributes:
@@ -654,63 +982,177 @@ class Certificate(object):
     - issuer_uid (optional)
     - subject_uid (optional)
     - extensions (list of extensions)
-    '''
 
-    def __init__(self, tbsCertificate):
-        self.version = tbsCertificate.getComponentByName("version")._value
-        self.serial_number = tbsCertificate.getComponentByName("serialNumber")._value
-        self.signature_algorithm = str(tbsCertificate.getComponentByName("signature"))
-        self.issuer = Name(tbsCertificate.getComponentByName("issuer"))
-        self.validity = ValidityInterval(tbsCertificate.getComponentByName("validity"))
-        self.subject = Name(tbsCertificate.getComponentByName("subject"))
-        self.pub_key_info = PublicKeyInfo(tbsCertificate.getComponentByName("subjectPublicKeyInfo"))
-
-        issuer_uid = tbsCertificate.getComponentByName("issuerUniqueID")
-        if issuer_uid:
-            self.issuer_uid = issuer_uid.toOctets()
-        else:
-            self.issuer_uid = None
+    Known extensions are also accessible through attributes named after
+    ExtensionType values (None if the extension is not present). With
+    lazy_extensions, non-critical extensions are decoded only when such
+    an attribute (or the extension's value) is first accessed.
+    '''
+    __slots__ = ("version", "serial_number", "signature_algorithm", "issuer",
+                 "validity", "subject", "pub_key_info", "issuer_uid",
+                 "subject_uid", "extensions")
+
+    #attribute: (TBSCertificate component, conversion of the component);
+    #extensions are handled separately
+    _fieldConverters = (
+        ("version", "version", lambda c: c._value),
+        ("serial_number", "serialNumber", lambda c: c._value),
+        ("signature_algorithm", "signature", str),
+        ("issuer", "issuer", lambda c: Name.from_asn1(c)),
+        ("validity", "validity", lambda c: ValidityInterval(c)),
+        ("subject", "subject", lambda c: Name.from_asn1(c)),
+        ("pub_key_info", "subjectPublicKeyInfo", lambda c: PublicKeyInfo.from_asn1(c)),
+        ("issuer_uid", "issuerUniqueID", lambda c: Certificate._unique_id(c)),
+        ("subject_uid", "subjectUniqueID", lambda c: Certificate._unique_id(c)),
+    )
+    #attribute -> TBSCertificate component
+    FIELDS = dict((attr, component) for (attr, component, convert) in _fieldConverters)
+    FIELDS["extensions"] = "extensions"
+
+    def __init__(self, tbsCertificate, lazy_extensions=False):
+        for (attr, component, convert) in Certificate._fieldConverters:
+            setattr(self, attr, convert(tbsCertificate.getComponentByName(component)))
+        self._set_extensions(tbsCertificate.getComponentByName('extensions'), lazy_extensions)
 
-        subject_uid = tbsCertificate.getComponentByName("subjectUniqueID")
-        if subject_uid:
-            self.subject_uid = subject_uid.toOctets()
-        else:
-            self.subject_uid = None
+    @staticmethod
+    def _unique_id(uid):
+        if uid:
+            return uid.toOctets()
+        return None
 
-        self.extensions = self._create_extensions_list(tbsCertificate.getComponentByName('extensions'))
+    def _set_extensions(self, extensions, lazy_extensions):
+        self.extensions = self._create_extensions_list(extensions, lazy_extensions)
 
-        #make known extensions accessible through attributes
-        for extAttrName in ExtensionTypes.knownExtensions:
-            setattr(self, extAttrName, None)
-        for ext in self.extensions:
-            if ext.ext_type:
-                setattr(self, ext.ext_type, ext)
+    def _find_extension(self, extType):
+        '''
+        Returns the (last) parsed extension of given ExtensionType or None.
+        Known extensions are read through properties calling this, so no
+        per-certificate attribute is needed for each of them.
+        '''
+        for ext in reversed(self.extensions):
+            if ext._declared_type == extType and ext.ext_type:
+                return ext
+        return None
 
-    def _create_extensions_list(self, extensions):
+    def _create_extensions_list(self, extensions, lazy=False):
         if extensions is None:
             return []
 
-        return [Extension(ext) for ext in extensions]
+        return [Extension(ext, lazy) for ext in extensions]
+
+for _extType in ExtensionTypes.knownExtensions:
+    setattr(Certificate, _extType,
+            property(lambda self, extType=_extType: self._find_extension(extType)))
+del _extType
 
 
-class X509Certificate(object):
+class X509Certificate(SlottedObject):
     '''
     Represents X509 certificate.
     Attributes:
     - signature_algorithm (used to sign this certificate)
     - signature
     - tbsCertificate (the certificate)
+    - raw_der_data (DER encoding the certificate was parsed from, "" if not
+      known)
+    - tbs_span ((start, end) offsets of tbsCertificate in raw_der_data)
+    Digests of the encoding are computed on first request and cached, see
+    fingerprint() and tbs_digest().
     '''
+    __slots__ = ("signature_algorithm", "signature", "tbsCertificate",
+                 "verification_results", "_raw_der_data", "_tbs_span",
+                 "_digests", "check_crl")
 
-    def __init__(self, certificate):
+    def __init__(self, certificate, lazy_extensions=False):
         self.signature_algorithm = str(certificate.getComponentByName("signatureAlgorithm"))
         self.signature = certificate.getComponentByName("signatureValue").toOctets()
         tbsCert = certificate.getComponentByName("tbsCertificate")
-        self.tbsCertificate = Certificate(tbsCert)
+        self.tbsCertificate = Certificate(tbsCert, lazy_extensions)
         self.verification_results = None
-        self.raw_der_data = ""  # raw der data for storage are kept here by cert_manager
+        self.raw_der_data = ""  # set by x509_parse (or by cert_manager)
         self.check_crl = True
 
+    def _get_raw_der_data(self):
+        return self._raw_der_data
+
+    def _set_raw_der_data(self, derData):
+        self.set_der_data(derData)
+
+    raw_der_data = property(_get_raw_der_data, _set_raw_der_data)
+
+    def set_der_data(self, derData, tbsSpan=None):
+        '''
+        Sets DER encoding of the certificate and optionally offsets of
+        tbsCertificate in it (found on first use otherwise). Cached digests
+        are dropped.
+        '''
+        self._raw_der_data = derData
+        self._tbs_span = tbsSpan
+        self._digests = {}
+
+    @property
+    def tbs_span(self):
+        if self._tbs_span is None and self._raw_der_data:
+            data = self._raw_der_data
+            tag, contentOffset, length = read_tlv(data, 0)
+            tag, tbsContentOffset, tbsLength = read_tlv(data, contentOffset,
+                                                        contentOffset + length)
+            self._tbs_span = (contentOffset, tbsContentOffset + tbsLength)
+        return self._tbs_span
+
+    def _digest(self, what, alg, data):
+        key = (what, alg)
+        digest = self._digests.get(key)
+        if digest is None:
+            if not self._raw_der_data:
+                raise CertificateError("DER encoding of the certificate is not known")
+            digest = hashlib.new(alg, data()).digest()
+            self._digests[key] = digest
+        return digest
+
+    def fingerprint(self, alg="sha256"):
+        '''
+        Returns digest (hashlib algorithm alg) of the DER encoding of the
+        certificate. Raises CertificateError if raw_der_data is not known.
+        '''
+        return self._digest("certificate", alg, lambda: self._raw_der_data)
+
+    def tbs_digest(self, alg="sha256"):
+        '''
+        Returns digest of the exact encoding of tbsCertificate (what the
+        signature is computed over).
+        '''
+        return self._digest("tbsCertificate", alg, self.tbs_bytes)
+
+    def tbs_bytes(self):
+        '''
+        Returns the exact encoding of tbsCertificate taken from raw_der_data.
+        '''
+        start, end = self.tbs_span
+        return self._raw_der_data[start:end]
+
+    def summary(self):
+        '''
+        Returns CertificateSummary of this certificate. fingerprint is None
+        unless raw_der_data is set.
+        '''
+        fingerprint = None
+        if self._raw_der_data:
+            fingerprint = self.fingerprint("sha256")
+        return CertificateSummary.from_certificate(self.tbsCertificate, fingerprint)
+
+    def copy(self):
+        '''
+        Returns shallow copy sharing the parsed certificate data (including
+        raw_der_data), which must be treated as read-only, but with fresh
+        verification state (verification_results, check_crl).
+        '''
+        cert = copy.copy(self)
+        cert._digests = dict(self._digests)
+        cert.verification_results = None
+        cert.check_crl = True
+        return cert
+
     def is_verified(self, ignore_missing_crl_check=False):
         '''
         Checks if all values of verification_results dictionary are True,
@@ -761,8 +1203,13 @@ class X509Certificate(object):
         return time_ok
 
     def crl_validity_at_date(self, date):
-        """check if the certificate was not on the CRL list at a particular date"""
-        rev_date = self.get_revocation_date()
+        """check if the certificate was not on the CRL list at a particular date;
+        None if no CRL of the issuer is available (which fails the verification
+        unless ignore_missing_crl_check is set)"""
+        try:
+            rev_date = self.get_revocation_date()
+        except CrlNotAvailableError:
+            return None
         if not rev_date:
             return True
         if date >= rev_date:
@@ -770,8 +1217,32 @@ class X509Certificate(object):
         else:
             return True
 
-    def get_revocation_date(self):
-        from certs.crl_store import CRL_cache_manager
+    def get_revocation_date(self, store=None, prefilter=None):
+        '''
+        Returns revocation date (datetime, UTC) of the certificate or None
+        if it is not revoked.
+        CRL of the issuer is looked up in store (crl_parse.revocation_store
+        by default); if it has none, the external certs.crl_store module is
+        used when available, otherwise CrlNotAvailableError is raised.
+        If prefilter (revocation_filter.RevocationFilter) was built from the
+        index of the issuer in store and rules the certificate out, the index
+        is not searched; a filter stale for the issuer is not consulted.
+        '''
+        import crl_parse
+        issuer = self.tbsCertificate.issuer
+        serial = self.tbsCertificate.serial_number
+        if store is None:
+            store = crl_parse.revocation_store
+        index = store.get(issuer)
+        if index is not None:
+            if prefilter is not None and prefilter.covers(index) and \
+                    not prefilter.might_contain(issuer, serial):
+                return None
+            return index.revocation_date(serial)
+        try:
+            from certs.crl_store import CRL_cache_manager
+        except ImportError:
+            raise CrlNotAvailableError("No CRL of %s is available" % issuer)
         cache = CRL_cache_manager.get_cache()
         issuer = str(self.tbsCertificate.issuer)
         rev_date = cache.certificate_rev_date(issuer, self.tbsCertificate.serial_number)
@@ -781,10 +1252,157 @@ class X509Certificate(object):
         return rev_date
 
 
-class Attribute(object):
+class PartialCertificate(Certificate):
+    '''
+    Certificate with only some fields parsed, see x509_parse(fields=...).
+    Attributes:
+    - parsed_fields (names of parsed fields, keys of Certificate.FIELDS)
+    Accessing other fields (or extension attributes if extensions were not
+    requested) raises FieldNotParsedError.
+    '''
+    __slots__ = ("parsed_fields",)
+
+    def __init__(self, components, fields, lazy_extensions=False):
+        '''
+        components maps names of TBSCertificate components to their decoded
+        values (None if not present).
+        '''
+        self.parsed_fields = frozenset(fields)
+        for (attr, component, convert) in Certificate._fieldConverters:
+            if attr in self.parsed_fields:
+                setattr(self, attr, convert(components[component]))
+        if "extensions" in self.parsed_fields:
+            self._set_extensions(components["extensions"], lazy_extensions)
+
+    def __getattr__(self, name):
+        # only called for unset slots, or when a property reading them fails
+        # (extension attributes without parsed extensions)
+        if name in Certificate.FIELDS or name in ExtensionTypes.knownExtensions:
+            raise FieldNotParsedError("Field %s was not parsed" % name)
+        raise AttributeError(name)
+
+
+class PartialX509Certificate(X509Certificate):
+    '''
+    X509 certificate with only some fields parsed, see x509_parse(fields=...).
+    tbsCertificate is PartialCertificate, signature_algorithm is parsed with
+    the signature_algorithm field and signature only if requested.
+    '''
+    __slots__ = ()
+
+    def __init__(self, tbsCertificate, signature_algorithm=None, signature=None):
+        if signature_algorithm is not None:
+            self.signature_algorithm = str(signature_algorithm)
+        if signature is not None:
+            self.signature = signature.toOctets()
+        self.tbsCertificate = tbsCertificate
+        self.verification_results = None
+        self.raw_der_data = ""
+        self.check_crl = True
+
+    def __getattr__(self, name):
+        if name in ("signature_algorithm", "signature"):
+            raise FieldNotParsedError("Field %s was not parsed" % name)
+        raise AttributeError(name)
+
+
+class CertificateSummary(namedtuple("CertificateSummary",
+        "fingerprint serial_number issuer_key subject_key not_before not_after "
+        "key_algorithm key_size subject_key_id authority_key_id is_ca "
+        "key_usage ext_key_usage dns_names")):
+    '''
+    Compact immutable record of the most used certificate fields, see
+    X509Certificate.summary() and x509_parse.summarize().
+    Attributes:
+    - fingerprint (SHA-256 of the DER encoding, None if not known)
+    - serial_number
+    - issuer_key, subject_key (Name.digest() of issuer and subject)
+    - not_before, not_after (validity as seconds since the epoch, UTC)
+    - key_algorithm (PublicKeyInfo.algName), key_size (bits, None if the
+      algorithm is not known)
+    - subject_key_id, authority_key_id (str or None)
+    - is_ca (from basic constraints)
+    - key_usage (KeyUsageExt flags, bit i is flag i of the extension),
+      ext_key_usage (ExtendedKeyUsageExt flags); None if the extension is
+      not present
+    - dns_names (tuple of DNS names of subject alternative name)
+    '''
+    __slots__ = ()
+
+    #fields of Certificate needed to build the summary
+    FIELDS = ("serial_number", "issuer", "subject", "validity", "pub_key_info", "extensions")
+
+    @classmethod
+    def from_certificate(cls, tbsCertificate, fingerprint=None):
+        '''
+        Builds summary of Certificate (only FIELDS need to be parsed).
+        '''
+        validity = tbsCertificate.validity
+        pubKeyInfo = tbsCertificate.pub_key_info
+
+        subjectKeyId = _extension_value(tbsCertificate.subjKeyIdExt)
+        authKeyId = _extension_value(tbsCertificate.authKeyIdExt)
+        basicConstraints = _extension_value(tbsCertificate.basicConstraintsExt)
+        keyUsage = _extension_value(tbsCertificate.keyUsageExt)
+        extKeyUsage = _extension_value(tbsCertificate.extKeyUsageExt)
+        altName = _extension_value(tbsCertificate.subjAltNameExt)
+
+        return cls(
+            fingerprint,
+            tbsCertificate.serial_number,
+            tbsCertificate.issuer.digest(),
+            tbsCertificate.subject.digest(),
+            _epoch_seconds(validity.get_valid_from_as_datetime()),
+            _epoch_seconds(validity.get_valid_to_as_datetime()),
+            pubKeyInfo.algName,
+            _key_size(pubKeyInfo),
+            subjectKeyId and subjectKeyId.subject_key_id,
+            getattr(authKeyId, "key_id", None),
+            bool(basicConstraints and basicConstraints.ca),
+            keyUsage and keyUsage._flags,
+            extKeyUsage and extKeyUsage._flags,
+            tuple(intern(value) for (key, value) in (altName and altName.items or ())
+                  if key == "DNS"),
+        )
+
+
+def _extension_value(extension):
+    if extension is None:
+        return None
+    return extension.value
+
+
+def _epoch_seconds(date):
+    return calendar.timegm(date.timetuple())
+
+
+def _key_size(pubKeyInfo):
+    '''
+    Returns size of RSA modulus or DSA prime p in bits or None.
+    '''
+    if pubKeyInfo.algType == PublicKeyInfo.RSA:
+        number = pubKeyInfo.key["mod"]
+    elif pubKeyInfo.algType == PublicKeyInfo.DSA:
+        number = pubKeyInfo.key["p"]
+    else:
+        return None
+    if isinstance(number, str):
+        number = long(number.encode("hex") or "0", 16)
+    return number.bit_length()
+
+
+class Attribute(SlottedObject):
     """
     One attribute in SignerInfo attributes set
+    Attributes:
+    - type (OID string)
+    - name (name of the type if known, else the OID)
+    - value (plain Python value: datetime for signingTime, SigningCertificate
+      for signingCertificate, otherwise see _plain_value)
+    - asn1 (decoded value, None unless created with keep_asn1)
     """
+    __slots__ = ("type", "value", "name", "asn1")
+
     _oid2Name = {
         "1.2.840.113549.1.9.1": "emailAddress",
         "1.2.840.113549.1.9.2": "unstructuredName",
@@ -798,20 +1416,25 @@ class Attribute(object):
         "2.5.4.5": "serialNumber",
     }
 
-    def __init__(self, attribute):
-        self.type = str(attribute.getComponentByName("type"))
-        self.value = attribute.getComponentByName("value").getComponentByPosition(0)
+    def __init__(self, attribute, keep_asn1=False):
+        self.type = tuple_to_OID(attribute.getComponentByName("type"))
+        asn1Value = attribute.getComponentByName("value").getComponentByPosition(0)
         self.name = self._oid2Name.get(self.type, self.type)
         if self.name == 'signingTime':
             self.value = ValidityInterval.parse_date(
                 ValidityInterval._getGeneralizedTime(attribute))
+        elif self.name == 'signingCertificate':
+            self.value = SigningCertificate(asn1Value)
+        else:
+            self.value = _plain_value(asn1Value)
+        self.asn1 = None
+        if keep_asn1:
+            self.asn1 = asn1Value
 
     def __str__(self):
         value = str(self.value)
         if self.name == 'messageDigest':
             value = base64.standard_b64encode(value)
-        elif self.name == 'signingCertificate':
-            value = SigningCertificate(self.value)
         elif self.name == 'contentType':
             value = ContentType(value)
         elif self.name == 'serialNumber':
@@ -819,10 +1442,12 @@ class Attribute(object):
         return "%s: %s" % (self.name, value)
 
 
-class ContentType(object):
+class ContentType(SlottedObject):
     """
     PKCS 7 content type
     """
+    __slots__ = ("value",)
+
     _oid2Name = {
         "1.2.840.113549.1.7.1": "data",
         "1.2.840.113549.1.7.2": "signedData",
@@ -839,7 +1464,7 @@ class ContentType(object):
         return self._oid2Name.get(self.value, self.value)
 
 
-class SigningCertificate(object):
+class SigningCertificate(SlottedObject):
     """
     Sequence of certs and policies defined in RFC 2634
 
@@ -847,22 +1472,29 @@ class SigningCertificate(object):
        certs        SEQUENCE OF ESSCertID,
        policies     SEQUENCE OF PolicyInformation OPTIONAL
     }
+
+    policies is list of the policy identifiers (OID strings).
     """
+    __slots__ = ("certs", "policies")
+
     def __init__(self, data):
         self.certs = []
         for cert in data.getComponentByPosition(0):
             self.certs.append(ESSCertID(cert))
         self.policies = []
         try:
-            self.policies = data.getComponentByPosition(1)
+            policies = data.getComponentByPosition(1)
         except IndexError:
-            pass
+            policies = None
+        if policies is not None:
+            self.policies = [tuple_to_OID(policy.getComponentByPosition(0))
+                             for policy in policies]
 
     def __str__(self):
         return ','.join([str(cert) for cert in self.certs])
 
 
-class ESSCertID(object):
+class ESSCertID(SlottedObject):
     """
     Certificate identifier RFC 2634
 
@@ -877,26 +1509,45 @@ class ESSCertID(object):
         issuer                   GeneralNames,
         serialNumber             CertificateSerialNumber
     }
+
+    hash is str, issuer tuple of (type, value) tuples of the GeneralNames
+    (see general_names_to_items); issuer and serial_number are None if
+    issuerSerial is not present.
     """
+    __slots__ = ("hash", "issuer", "serial_number")
+
     def __init__(self, data):
-        self.hash = data.getComponentByPosition(0)
-        self.issuer = data.getComponentByPosition(1).getComponentByPosition(0)
-        self.serial_number = data.getComponentByPosition(1).getComponentByPosition(1)._value
+        self.hash = str(data.getComponentByPosition(0))
+        self.issuer = None
+        self.serial_number = None
+        try:
+            issuerSerial = data.getComponentByPosition(1)
+        except IndexError:
+            issuerSerial = None
+        if issuerSerial is not None:
+            #the attribute is decoded without spec, decode GeneralNames
+            #properly to get the names
+            generalNames = decode(encoder.encode(issuerSerial.getComponentByPosition(0)),
+                                  asn1Spec=current_session().templates.get(GeneralNames))[0]
+            self.issuer = general_names_to_items(generalNames)
+            self.serial_number = issuerSerial.getComponentByPosition(1)._value
 
     def __str__(self):
         return "0x%x" % self.serial_number
 
-class AutheticatedAttributes(object):
+class AutheticatedAttributes(SlottedObject):
     """
     Authenticated attributes of signer info
     """
-    def __init__(self, auth_attributes):
+    __slots__ = ("attributes",)
+
+    def __init__(self, auth_attributes, keep_asn1=False):
         self.attributes = []
         for aa in auth_attributes:
-            self.attributes.append(Attribute(aa))
+            self.attributes.append(Attribute(aa, keep_asn1))
 
 
-class SignerInfo(object):
+class SignerInfo(SlottedObject):
     """
     Represents information about a signer.
     Attributes:
@@ -907,10 +1558,15 @@ class SignerInfo(object):
     - encryp_algorithm
     - signature
     - auth_atributes (optional field, contains authenticated attributes)
+    All values are converted to plain Python values, decoded ASN1 values of
+    the attributes are kept only if keep_asn1 is set.
     """
-    def __init__(self, signer_info):
+    __slots__ = ("version", "issuer", "serial_number", "digest_algorithm",
+                 "encrypt_algorithm", "signature", "auth_attributes")
+
+    def __init__(self, signer_info, keep_asn1=False):
         self.version = signer_info.getComponentByName("version")._value
-        self.issuer = Name(signer_info.getComponentByName("issuerAndSerialNum").getComponentByName("issuer"))
+        self.issuer = Name.from_asn1(signer_info.getComponentByName("issuerAndSerialNum").getComponentByName("issuer"))
         self.serial_number = signer_info.getComponentByName("issuerAndSerialNum").getComponentByName("serialNumber")._value
         self.digest_algorithm = str(signer_info.getComponentByName("digestAlg"))
         self.encrypt_algorithm = str(signer_info.getComponentByName("encryptAlg"))
@@ -919,19 +1575,23 @@ class SignerInfo(object):
         if auth_attrib is None:
             self.auth_attributes = None
         else:
-            self.auth_attributes = AutheticatedAttributes(auth_attrib)
+            self.auth_attributes = AutheticatedAttributes(auth_attrib, keep_asn1)
 
 
 ######
 #TSTinfo
 ######
-class MsgImprint(object):
+class MsgImprint(SlottedObject):
+    __slots__ = ("alg", "imprint")
+
     def __init__(self, asn1_msg_imprint):
         self.alg = str(asn1_msg_imprint.getComponentByName("algId"))
         self.imprint = str(asn1_msg_imprint.getComponentByName("imprint"))
 
 
-class TsAccuracy(object):
+class TsAccuracy(SlottedObject):
+    __slots__ = ("seconds", "milis", "micros")
+
     def __init__(self, asn1_acc):
         secs = asn1_acc.getComponentByName("seconds")
         if secs:
@@ -944,24 +1604,43 @@ class TsAccuracy(object):
             self.micros = micros._value
 
 
-class TimeStampToken(object):
+class TimeStampToken(SlottedObject):
     '''
     Holder for Timestamp Token Info - attribute from the qtimestamp.
+    Signing certificates are added by add_certificate() and kept as DER
+    (der_certificates); their decoded form is kept in asn1_certificates
+    only if keep_asn1 is set, so that the token does not keep the decoded
+    timestamp alive.
     '''
-    def __init__(self, asn1_tstInfo):
+    __slots__ = ("version", "policy", "msgImprint", "serialNum", "genTime",
+                 "accuracy", "tsa", "asn1_certificates", "der_certificates",
+                 "certificates", "keep_asn1")
+
+    def __init__(self, asn1_tstInfo, keep_asn1=False):
         self.version = asn1_tstInfo.getComponentByName("version")._value
         self.policy = str(asn1_tstInfo.getComponentByName("policy"))
         self.msgImprint = MsgImprint(asn1_tstInfo.getComponentByName("messageImprint"))
         self.serialNum = asn1_tstInfo.getComponentByName("serialNum")._value
         self.genTime = asn1_tstInfo.getComponentByName("genTime")._value
         self.accuracy = TsAccuracy(asn1_tstInfo.getComponentByName("accuracy"))
-        self.tsa = Name(asn1_tstInfo.getComponentByName("tsa"))
-        # place for parsed certificates in asn1 form
+        self.tsa = Name.from_asn1(asn1_tstInfo.getComponentByName("tsa"))
+        self.keep_asn1 = keep_asn1
+        # place for parsed certificates in asn1 form (only with keep_asn1)
         self.asn1_certificates = []
+        # DER encoding of the certificates
+        self.der_certificates = []
         # place for certificates transformed to X509Certificate
         self.certificates = []
         #self.extensions = asn1_tstInfo.getComponentByName("extensions")
 
+    def add_certificate(self, asn1_certificate):
+        """
+        Adds signing certificate of the timestamp.
+        """
+        self.der_certificates.append(encoder.encode(asn1_certificate))
+        if self.keep_asn1:
+            self.asn1_certificates.append(asn1_certificate)
+
     def certificates_contain(self, cert_serial_num):
         """
         Checks if set of certificates of this timestamp contains
@@ -993,3 +1672,11 @@ class TimeStampToken(object):
         tz_delta = datetime.timedelta(seconds=time.daylight and time.altzone
                                         or time.timezone)
         return datetime.datetime(year, month, day, hour, minute, second, micro) - tz_delta
+
+
+# OIDs known to the models, see oid_registry
+oidRegistry.register(*Name._oid2Name)
+oidRegistry.register(*Extension._extensionDecoders)
+oidRegistry.register(*ExtendedKeyUsageExt._keyPurposeAttrs)
+oidRegistry.register(*Attribute._oid2Name)
+oidRegistry.register(*ContentType._oid2Name)
@@ -5,14 +5,19 @@ from pkcs7 import pkcs7_decoder
 from x509_parse import print_certificate_details
 from pkcs7_models import X509Certificate, SignerInfo
 from pkcs7.asn1_models.oid import oid_map
+from parse_session import current_session
 
 
-def pkcs7_parse(derData):
+def pkcs7_parse(derData, session=None):
     """Decodes certificate.
     @param derData: DER-encoded pkcs7
+    @param session: parse_session.ParseSession to decode in (the active
+        one, see current_session(), by default)
     @returns: PKCS7 structure (tree).
     """
-    return pkcs7_decoder.decode_qts(derData)
+    if session is None:
+        session = current_session()
+    return pkcs7_decoder.decode_qts(derData, session)
 
 
 def print_signature_info(derData):
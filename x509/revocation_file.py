@@ -0,0 +1,252 @@
+#!/usr/bin/python
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Revocation files: revocation indexes (see crl_parse) of any number of
+issuers stored in one file.
+
+The records of the indexes are stored exactly as RevocationIndex keeps them
+in memory, so RevocationFile memory-maps the file read-only and searches
+the records in place. Processes opening the same file share its pages; none
+of them has to parse the CRLs or copy the records.
+
+Layout (all integers big endian):
+- header: magic, format version, number of issuers
+- directory: one entry per issuer, see _DIRECTORY_ENTRY
+- per issuer: DER of the issuer Name and content octets of the CRL number,
+  followed by the records, aligned to 8 octets
+'''
+
+import os
+import sys
+import mmap
+import struct
+import calendar
+import tempfile
+
+import crl_parse
+from crl_parse import RevocationIndex
+
+MAGIC = "PYX509RI"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct(">8sHxxI")
+# issuer digest (pkcs7_models.Name.digest), thisUpdate, nextUpdate (seconds
+# since the epoch, _NO_TIME if absent), offset of the issuer DER, lengths of
+# the issuer DER and the CRL number (0 if absent), key width, offset of the
+# records and their number
+_DIRECTORY_ENTRY = struct.Struct(">20sqqQHHHxxQQ")
+
+_NO_TIME = -(1 << 63)
+_ALIGNMENT = 8
+
+
+class RevocationFileError(ValueError):
+    '''
+    Raised when a file is not a valid revocation file or revocation filter
+    (truncated, of other format or version).
+    '''
+    pass
+
+
+def _datetime_to_epoch(date):
+    if date is None:
+        return _NO_TIME
+    return calendar.timegm(date.utctimetuple())
+
+
+def _time_from_epoch(seconds):
+    if seconds == _NO_TIME:
+        return None
+    return crl_parse.epoch_to_datetime(seconds)
+
+
+def _padding(offset):
+    return -offset % _ALIGNMENT
+
+
+def replace_file(path, write):
+    '''
+    Writes file at path by calling write(f) with the new file opened for
+    writing. The file is written next to path and renamed over it, so
+    processes opening path always see a complete file; those having the old
+    file open keep using it.
+    '''
+    fd, tempPath = tempfile.mkstemp(prefix=".revocations", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tempPath, 0644)
+        os.rename(tempPath, path)
+    except Exception:
+        os.unlink(tempPath)
+        raise
+
+
+def write_revocation_file(path, indexes):
+    '''
+    Writes RevocationIndexes (at most one per issuer) to file at path,
+    replacing it atomically (see replace_file). Indexes updated by delta
+    CRLs are written compacted.
+    '''
+    indexes = [index.compacted() for index in indexes]
+    digests = set()
+    parts = []      # (issuer DER, CRL number octets, index)
+    for index in indexes:
+        digest = index.issuer.digest()
+        if digest in digests:
+            raise ValueError("More than one index of issuer %s" % index.issuer)
+        if index.delta_base is not None:
+            raise ValueError("Index of delta CRL of %s can not be stored" % index.issuer)
+        if index.issuer_der is None:
+            raise ValueError("DER of issuer %s is not known" % index.issuer)
+        digests.add(digest)
+        crlNumber = ""
+        if index.crl_number is not None:
+            crlNumber = crl_parse.integer_content(index.crl_number)
+        parts.append((index.issuer_der, crlNumber, index))
+
+    offset = _HEADER.size + _DIRECTORY_ENTRY.size * len(parts)
+    directory = []
+    for issuerDer, crlNumber, index in parts:
+        metaOffset = offset
+        offset += len(issuerDer) + len(crlNumber)
+        offset += _padding(offset)
+        directory.append(_DIRECTORY_ENTRY.pack(
+            index.issuer.digest(),
+            _datetime_to_epoch(index.this_update),
+            _datetime_to_epoch(index.next_update),
+            metaOffset, len(issuerDer), len(crlNumber), index.key_width,
+            offset, len(index)))
+        offset += len(index.records)
+
+    def write(f):
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(parts)))
+        f.write("".join(directory))
+        for issuerDer, crlNumber, index in parts:
+            f.write(issuerDer)
+            f.write(crlNumber)
+            f.write("\x00" * _padding(f.tell()))
+            f.write(index.records)
+
+    replace_file(path, write)
+
+
+class RevocationFile(object):
+    '''
+    Read-only revocation file. It can be used wherever RevocationStore is
+    accepted (e.g. X509Certificate.get_revocation_date(store=...)).
+    The indexes it returns read the mapped file, so they must not be used
+    after close().
+    '''
+
+    def __init__(self, path):
+        '''
+        Raises RevocationFileError if the file is not a valid revocation
+        file.
+        '''
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise RevocationFileError('Revocation file is truncated')
+            self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._indexes = self._read_directory()
+        except Exception:
+            self._mapping.close()
+            raise
+
+    def _read_directory(self):
+        mapping = self._mapping
+        if len(mapping) < _HEADER.size:
+            raise RevocationFileError('Revocation file is truncated')
+        magic, version, count = _HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC:
+            raise RevocationFileError('Not a revocation file')
+        if version != FORMAT_VERSION:
+            raise RevocationFileError('Unsupported revocation file version %d' % version)
+        if len(mapping) < _HEADER.size + _DIRECTORY_ENTRY.size * count:
+            raise RevocationFileError('Revocation file is truncated')
+
+        indexes = {}
+        for position in xrange(count):
+            (digest, thisUpdate, nextUpdate, metaOffset, issuerLength,
+             crlNumberLength, keyWidth, recordsOffset, recordCount) = \
+                _DIRECTORY_ENTRY.unpack_from(mapping, _HEADER.size + _DIRECTORY_ENTRY.size * position)
+            recordsLength = recordCount * (keyWidth + crl_parse.RECORD_VALUE_SIZE)
+            if metaOffset + issuerLength + crlNumberLength > recordsOffset or \
+                    recordsOffset + recordsLength > len(mapping):
+                raise RevocationFileError('Revocation file is truncated')
+            issuerDer = mapping[metaOffset:metaOffset + issuerLength]
+            crlNumber = None
+            if crlNumberLength:
+                crlNumberOffset = metaOffset + issuerLength
+                crlNumber = crl_parse.integer_from_content(
+                    mapping[crlNumberOffset:crlNumberOffset + crlNumberLength])
+            indexes[digest] = RevocationIndex(
+                crl_parse.decode_issuer(issuerDer),
+                _time_from_epoch(thisUpdate), _time_from_epoch(nextUpdate),
+                crlNumber, buffer(mapping, recordsOffset, recordsLength),
+                keyWidth, issuerDer)
+        return indexes
+
+    def get(self, issuer):
+        '''
+        Returns RevocationIndex of issuer (pkcs7_models.Name) or None.
+        '''
+        return self._indexes.get(issuer.digest())
+
+    def get_by_digest(self, issuer_digest):
+        '''
+        Returns RevocationIndex of issuer given by its Name.digest() or None.
+        '''
+        return self._indexes.get(issuer_digest)
+
+    def issuers(self):
+        return [index.issuer for index in self._indexes.itervalues()]
+
+    def __iter__(self):
+        return self._indexes.itervalues()
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def close(self):
+        self._indexes = {}
+        self._mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print >> sys.stderr, "Usage: revocation_file.py output_file crl [crl ...]"
+        sys.exit(1)
+
+    store = crl_parse.RevocationStore()
+    for crlPath in sys.argv[2:]:
+        store.add(crl_parse.read_crl(crlPath))
+    write_revocation_file(sys.argv[1], [store.get(issuer) for issuer in store.issuers()])
+    with RevocationFile(sys.argv[1]) as revocations:
+        for crlIndex in revocations:
+            print "%s: %d revoked certificates, CRL number %s" % (
+                crlIndex.issuer, len(crlIndex), crlIndex.crl_number)
@@ -0,0 +1,269 @@
+#!/usr/bin/python
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Bloom filter of revoked certificates of many issuers.
+
+RevocationFilter answers whether a certificate (issuer, serial number)
+might be revoked. "No" is definitive, "maybe" is wrong with probability
+false_positive_rate and has to be confirmed by the revocation index (see
+X509Certificate.get_revocation_date(prefilter=...)). Since almost all
+certificates checked are not revoked, most checks end in the filter, which
+takes about 1.8 bytes per revoked certificate at 0.1 % false positives.
+
+The filter remembers the CRL (CRL number and thisUpdate) of every issuer
+it was built from; it is consulted only for certificates of issuers whose
+current index is that very CRL (see covers()). For issuers with newer CRLs
+or delta CRLs applied since, the filter is stale and must not be used, so
+certificates are looked up in the index.
+
+Filters are stored to files (header, the CRLs covered and the bit array)
+by write_filter() and memory-mapped by read_filter(), so they are cheap to
+ship to and load on many nodes.
+'''
+
+import os
+import sys
+import math
+import mmap
+import struct
+import hashlib
+
+import crl_parse
+from revocation_file import replace_file, RevocationFileError
+
+MAGIC = "PYX509BF"
+FORMAT_VERSION = 2
+
+# magic, format version, number of hash functions, number of bits, number
+# of certificates added, number of CRLs covered
+_HEADER = struct.Struct(">8sHHQQI")
+# issuer digest (pkcs7_models.Name.digest) and _index_tag of its CRL
+_SOURCE = struct.Struct(">20s16s")
+_HASHES = struct.Struct(">QQ")
+
+
+def _filter_key(issuerDigest, serial):
+    '''
+    Returns key of certificate given by digest of issuer (Name.digest()) and
+    serial number.
+    '''
+    return issuerDigest + crl_parse.integer_content(serial)
+
+
+def _index_tag(index):
+    '''
+    Returns digest identifying the CRL of RevocationIndex: its CRL number
+    and thisUpdate, which both change when a delta CRL is applied.
+    '''
+    return hashlib.md5("%s/%s" % (index.crl_number, index.this_update.isoformat())).digest()
+
+
+class RevocationFilter(object):
+    '''
+    Attributes:
+    - bit_count, hash_count (size of the filter and number of bits set per
+      certificate)
+    - count (number of certificates added)
+    - sources (dictionary of _index_tags of the CRLs added by issuer digest)
+    Bit positions of a certificate are derived from MD5 of its key by double
+    hashing (Kirsch, Mitzenmacher), so only one digest is computed per check.
+    '''
+
+    def __init__(self, bit_count, hash_count, bits=None, count=0, sources=None):
+        '''
+        bits are the filter bits (str, buffer or mmap of a stored filter,
+        the filter is read-only then) or None for an empty filter.
+        '''
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.count = count
+        if sources is None:
+            sources = {}
+        self.sources = sources
+        if bits is None:
+            bits = bytearray((bit_count + 7) // 8)
+        elif len(bits) * 8 < bit_count:
+            raise RevocationFileError('Revocation filter is truncated')
+        self.bits = bits
+        if isinstance(bits, bytearray):
+            self._byteAt = bits.__getitem__
+        else:
+            self._byteAt = lambda index: ord(bits[index])
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=0.001):
+        '''
+        Returns empty filter sized for capacity certificates.
+        '''
+        capacity = max(capacity, 1)
+        bitCount = int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        hashCount = max(1, int(round(float(bitCount) / capacity * math.log(2))))
+        return cls(bitCount, hashCount)
+
+    @classmethod
+    def from_indexes(cls, indexes, false_positive_rate=0.001):
+        '''
+        Returns filter of certificates revoked by RevocationIndexes (e.g. a
+        RevocationStore or RevocationFile).
+        '''
+        indexes = [index for index in indexes if index.delta_base is None]
+        result = cls.for_capacity(sum(len(index) for index in indexes), false_positive_rate)
+        for index in indexes:
+            result.add_index(index)
+        return result
+
+    def _positions(self, key):
+        '''
+        Yields bit positions of key.
+        '''
+        bitCount = self.bit_count
+        first, second = _HASHES.unpack(hashlib.md5(key).digest())
+        position = first % bitCount
+        step = (second | 1) % bitCount
+        for i in xrange(self.hash_count):
+            yield position
+            position = (position + step) % bitCount
+
+    def _add_key(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def _check_writable(self):
+        if not isinstance(self.bits, bytearray):
+            raise TypeError("Stored revocation filter is read-only")
+
+    def add(self, issuer, serial):
+        '''
+        Adds certificate. The filter is consulted for the issuer only if its
+        CRL was added by add_index().
+        '''
+        self._check_writable()
+        self._add_key(_filter_key(issuer.digest(), serial))
+
+    def add_index(self, index):
+        '''
+        Adds certificates revoked by RevocationIndex (of a complete CRL,
+        possibly with delta CRLs applied) and remembers its CRL.
+        '''
+        self._check_writable()
+        if index.delta_base is not None:
+            raise ValueError("Delta CRL of %s can not be added to a filter" % index.issuer)
+        issuerDigest = index.issuer.digest()
+        for entry in index:
+            self._add_key(_filter_key(issuerDigest, entry.serial_number))
+        self.sources[issuerDigest] = _index_tag(index)
+
+    def covers(self, index):
+        '''
+        Returns True if the filter was built from RevocationIndex index, so
+        might_contain() answers for certificates of its issuer. False means
+        the filter does not know the issuer or is stale for it (the index is
+        of another CRL or has delta CRLs applied since).
+        '''
+        return self.sources.get(index.issuer.digest()) == _index_tag(index)
+
+    def might_contain(self, issuer, serial):
+        '''
+        Returns False if certificate of issuer (pkcs7_models.Name) with
+        given serial number is certainly not revoked by the CRL the filter
+        was built from; check covers() first.
+        '''
+        return self.might_contain_digest(issuer.digest(), serial)
+
+    def might_contain_digest(self, issuer_digest, serial):
+        '''
+        Same as might_contain(), issuer is given by its Name.digest().
+        '''
+        byteAt = self._byteAt
+        for position in self._positions(_filter_key(issuer_digest, serial)):
+            if not byteAt(position >> 3) & (1 << (position & 7)):
+                return False
+        return True
+
+    def false_positive_rate(self):
+        '''
+        Returns expected rate of false positives given the number of
+        certificates added.
+        '''
+        return (1.0 - math.exp(-float(self.hash_count) * self.count / self.bit_count)) ** self.hash_count
+
+    def to_string(self):
+        sources = "".join(_SOURCE.pack(issuerDigest, tag)
+                          for (issuerDigest, tag) in sorted(self.sources.iteritems()))
+        return _HEADER.pack(MAGIC, FORMAT_VERSION, self.hash_count, self.bit_count,
+                            self.count, len(self.sources)) + sources + str(self.bits)
+
+    @classmethod
+    def from_string(cls, data):
+        '''
+        Returns read-only filter of data made by to_string() (str, or mmap
+        which is used in place). Raises RevocationFileError if data is not
+        a valid filter.
+        '''
+        if len(data) < _HEADER.size:
+            raise RevocationFileError('Revocation filter is truncated')
+        magic, version = _HEADER.unpack_from(data, 0)[:2]
+        if magic != MAGIC:
+            raise RevocationFileError('Not a revocation filter')
+        if version != FORMAT_VERSION:
+            raise RevocationFileError('Unsupported revocation filter version %d' % version)
+        magic, version, hashCount, bitCount, count, sourceCount = _HEADER.unpack_from(data, 0)
+        bitsOffset = _HEADER.size + _SOURCE.size * sourceCount
+        if len(data) < bitsOffset:
+            raise RevocationFileError('Revocation filter is truncated')
+        sources = dict(_SOURCE.unpack_from(data, _HEADER.size + _SOURCE.size * position)
+                       for position in xrange(sourceCount))
+        return cls(bitCount, hashCount, buffer(data, bitsOffset), count, sources)
+
+
+def write_filter(path, revocationFilter):
+    '''
+    Writes filter to file at path, replacing it atomically (see
+    revocation_file.replace_file).
+    '''
+    replace_file(path, lambda f: f.write(revocationFilter.to_string()))
+
+
+def read_filter(path):
+    '''
+    Returns read-only filter stored in file at path. The file is
+    memory-mapped, so processes reading it share the memory.
+    Raises RevocationFileError if the file is not a valid filter.
+    '''
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise RevocationFileError('Revocation filter is truncated')
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return RevocationFilter.from_string(mapping)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print >> sys.stderr, "Usage: revocation_filter.py output_file false_positive_rate crl [crl ...]"
+        sys.exit(1)
+
+    store = crl_parse.RevocationStore()
+    for crlPath in sys.argv[3:]:
+        store.add(crl_parse.read_crl(crlPath))
+    result = RevocationFilter.from_indexes(store, float(sys.argv[2]))
+    write_filter(sys.argv[1], result)
+    print "%d certificates, %d bits, %d hashes, expected false positive rate %g" % (
+        result.count, result.bit_count, result.hash_count, result.false_positive_rate())
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+#*    pyx509 - Python library for parsing X.509
+#*    Copyright (C) 2009-2012  CZ.NIC, z.s.p.o. (http://www.nic.cz)
+#*
+#*    This library is free software; you can redistribute it and/or
+#*    modify it under the terms of the GNU Library General Public
+#*    License as published by the Free Software Foundation; either
+#*    version 2 of the License, or (at your option) any later version.
+#*
+#*    This library is distributed in the hope that it will be useful,
+#*    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#*    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#*    Library General Public License for more details.
+#*
+#*    You should have received a copy of the GNU Library General Public
+#*    License along with this library; if not, write to the Free
+#*    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#*
+'''
+Streaming reader of files with many concatenated certificates.
+
+The file is memory-mapped and walked one item at a time, so memory use does
+not depend on the file size. Items may be PEM blocks (text between them,
+e.g. comments of CA bundles, is skipped) or raw DER certificates, whose end
+is found from the length of the outer SEQUENCE. Only the SEQUENCE tag with
+long form length octets starts DER (certificates are longer than 127
+octets), so a "0" in the text is not taken for the start of DER.
+'''
+
+import sys
+import mmap
+import base64
+from collections import namedtuple
+
+from pyasn1 import error
+
+from pkcs7.der_index import read_tlv, TAG_SEQUENCE
+from x509_parse import x509_parse
+
+PEM_BEGIN = "-----BEGIN "
+PEM_END = "-----END "
+# PEM labels of blocks containing a certificate, other blocks are skipped
+PEM_CERTIFICATE_LABELS = ("CERTIFICATE", "X509 CERTIFICATE", "TRUSTED CERTIFICATE")
+
+_WHITESPACE = " \t\r\n"
+
+# One item of a bundle. offset and end delimit the item in the file, reading
+# can be resumed from end. Exactly one of certificate (X509Certificate) and
+# error (exception raised by x509_parse) is not None.
+BundleEntry = namedtuple("BundleEntry", "offset end certificate error")
+
+
+def _read_pem(mapping, offset):
+    '''
+    Reads PEM block starting at offset.
+    Returns tuple (label, DER data, end offset).
+    '''
+    lineEnd = mapping.find("\n", offset)
+    if lineEnd < 0:
+        raise error.PyAsn1Error('Unterminated PEM header at offset %d' % offset)
+    header = mapping[offset:lineEnd].strip()
+    if not header.endswith("-----"):
+        raise error.PyAsn1Error('Malformed PEM header at offset %d' % offset)
+    label = header[len(PEM_BEGIN):-len("-----")]
+
+    endMarker = PEM_END + label + "-----"
+    bodyEnd = mapping.find(endMarker, lineEnd)
+    if bodyEnd < 0:
+        raise error.PyAsn1Error('Missing PEM footer of block at offset %d' % offset)
+    end = bodyEnd + len(endMarker)
+
+    derData = None
+    if label in PEM_CERTIFICATE_LABELS:
+        try:
+            derData = base64.b64decode(mapping[lineEnd:bodyEnd])
+        except TypeError, e:
+            raise error.PyAsn1Error('Bad base64 in PEM block at offset %d: %s' % (offset, e))
+    return label, derData, end
+
+
+def _is_der(mapping, offset, size):
+    '''
+    Returns True if DER starts at offset: SEQUENCE tag followed by long form
+    (or otherwise non-ASCII) length octet. "0" followed by text is not DER.
+    '''
+    return ord(mapping[offset]) == TAG_SEQUENCE and offset + 1 < size and \
+        ord(mapping[offset + 1]) >= 0x80
+
+
+def _der_end(mapping, offset, size):
+    '''
+    Returns end of DER certificate starting at offset. Raises PyAsn1Error
+    if its length octets are malformed or the file ends before it does.
+    '''
+    if not 0x81 <= ord(mapping[offset + 1]) <= 0x84:
+        raise error.PyAsn1Error('Malformed length of DER item at offset %d' % offset)
+    try:
+        tag, contentOffset, length = read_tlv(mapping, offset, size)
+    except error.PyAsn1Error, e:
+        raise error.PyAsn1Error('Truncated DER item at offset %d: %s' % (offset, e))
+    return contentOffset + length
+
+
+def _iter_items(mapping, offset):
+    '''
+    Yields tuples (offset, end, DER data) of certificates in mapping.
+    '''
+    size = len(mapping)
+    while offset < size:
+        char = mapping[offset]
+        if char in _WHITESPACE:
+            offset += 1
+        elif _is_der(mapping, offset, size):
+            derEnd = _der_end(mapping, offset, size)
+            yield offset, derEnd, mapping[offset:derEnd]
+            offset = derEnd
+        elif mapping[offset:offset + len(PEM_BEGIN)] == PEM_BEGIN:
+            label, derData, end = _read_pem(mapping, offset)
+            if derData is not None:
+                yield offset, end, derData
+            offset = end
+        else:
+            # text outside of PEM blocks
+            nextBlock = mapping.find(PEM_BEGIN, offset)
+            if nextBlock < 0:
+                break
+            offset = nextBlock
+
+
+def iter_bundle(bundle, offset=0, lazy_extensions=False):
+    '''
+    Reads certificates from file with concatenated PEM or DER certificates.
+    @param bundle: file name or file object opened for reading
+    @param offset: start reading at this offset, e.g. end of the last
+        BundleEntry processed before
+    @param lazy_extensions: passed to x509_parse
+    @returns: generator of BundleEntry; errors of single certificates are
+        captured in BundleEntry.error, PyAsn1Error is raised if the
+        structure of the file is broken
+    '''
+    if hasattr(bundle, "fileno"):
+        f = bundle
+    else:
+        f = open(bundle, "rb")
+    try:
+        f.seek(0, 2)
+        if f.tell() == 0:
+            return
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start, end, derData in _iter_items(mapping, offset):
+                try:
+                    yield BundleEntry(start, end, x509_parse(derData, lazy_extensions), None)
+                except Exception, e:
+                    yield BundleEntry(start, end, None, e)
+        finally:
+            mapping.close()
+    finally:
+        if f is not bundle:
+            f.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print >> sys.stderr, "Usage: x509_bundle.py bundle [offset]"
+        sys.exit(1)
+
+    startOffset = len(sys.argv) > 2 and int(sys.argv[2]) or 0
+    for entry in iter_bundle(sys.argv[1], startOffset):
+        if entry.error is not None:
+            print "%d-%d: error: %s" % (entry.offset, entry.end, entry.error)
+        else:
+            print "%d-%d: %s" % (entry.offset, entry.end, entry.certificate.tbsCertificate.subject)
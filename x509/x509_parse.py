@@ -18,24 +18,220 @@
 #*
 
 import sys
+import multiprocessing
 from binascii import hexlify
+from collections import namedtuple
 
-from pkcs7.asn1_models.X509_certificate import Certificate
-from pkcs7_models import X509Certificate, PublicKeyInfo, ExtendedKeyUsageExt
-from pkcs7.asn1_models.decoder_workarounds import decode
+from pkcs7.asn1_models.X509_certificate import Certificate, TBSCertificate
+from pkcs7.asn1_models.general_types import AlgorithmIdentifier, ConvertibleBitString
+from pkcs7_models import X509Certificate, PublicKeyInfo, ExtendedKeyUsageExt, \
+    PartialCertificate, PartialX509Certificate, CertificateSummary
+from pkcs7.der_index import index_certificate, read_tlv
+from pkcs7.asn1_models.decoder_workarounds import decode, as_substrate
+from pkcs7.asn1_models.spec_templates import templates
 from pkcs7.asn1_models.oid import oid_map
+from parse_session import current_session
 
 
-def x509_parse(derData):
+def x509_parse(derData, lazy_extensions=False, cache=None, fields=None, session=None):
     """Decodes certificate.
     @param derData: DER-encoded certificate string
-    @returns: pkcs7_models.X509Certificate
+    @param lazy_extensions: decode non-critical extensions only when they
+        are first accessed
+    @param cache: caches.X509ParseCache; if the certificate parsed the same
+        way (lazy_extensions, fields) is found there, copy of the cached
+        X509Certificate is returned; parse_cache of the active session by
+        default
+    @param fields: if given, only these fields are decoded (see
+        PARSEABLE_FIELDS) and PartialX509Certificate is returned; access to
+        other fields raises FieldNotParsedError
+    @param session: parse_session.ParseSession to parse in (the active one,
+        see current_session(), by default)
+    @returns: pkcs7_models.X509Certificate; derData (up to the end of the
+        certificate, octets following it are ignored) is kept as its
+        raw_der_data
     """
-    cert = decode(derData, asn1Spec=Certificate())[0]
-    x509cert = X509Certificate(cert)
+    if session is not None:
+        with session:
+            return x509_parse(derData, lazy_extensions, cache, fields)
+    session = current_session()
+    if cache is None:
+        cache = session.parse_cache
+    derData = _certificate_der(derData)
+    if cache is not None:
+        key = cache.key(derData, lazy_extensions, fields)
+        x509cert = cache.get_certificate(key)
+        if x509cert is not None:
+            return x509cert
+    if fields is not None:
+        x509cert = _x509_parse_fields(derData, fields, lazy_extensions, session.templates)
+    else:
+        cert = decode(derData, asn1Spec=session.templates.get(Certificate))[0]
+        x509cert = X509Certificate(cert, lazy_extensions)
+        x509cert.set_der_data(derData)
+    if cache is not None:
+        cache.put_certificate(key, x509cert)
     return x509cert
 
 
+def summarize(derData, session=None):
+    """Returns pkcs7_models.CertificateSummary of certificate.
+    Only the fields needed for the summary and the extensions it uses are
+    decoded, X509Certificate is not built.
+    """
+    if session is not None:
+        with session:
+            return summarize(derData)
+    x509cert = _x509_parse_fields(_certificate_der(derData), CertificateSummary.FIELDS, True,
+                                  current_session().templates)
+    return CertificateSummary.from_certificate(x509cert.tbsCertificate,
+                                               x509cert.fingerprint("sha256"))
+
+
+def _certificate_der(derData):
+    """Returns derData as str without octets following the certificate, so
+    that they do not get into raw_der_data, fingerprints and cache keys.
+    """
+    derData = as_substrate(derData)
+    tag, contentOffset, length = read_tlv(derData, 0)
+    end = contentOffset + length
+    if end < len(derData):
+        derData = derData[:end]
+    return derData
+
+
+# attributes of tbsCertificate plus signature of the certificate
+PARSEABLE_FIELDS = frozenset(PartialCertificate.FIELDS.keys() + ["signature"])
+
+
+def _tbs_component_specs(specTemplates):
+    """Returns dictionary of component specs of TBSCertificate template
+    of specTemplates by component name.
+    """
+    componentType = specTemplates.get(TBSCertificate).getComponentType()
+    return dict((componentType.getNameByPosition(idx), componentType.getTypeByPosition(idx))
+                for idx in xrange(len(componentType)))
+
+
+def _x509_parse_fields(derData, fields, lazy_extensions, specTemplates):
+    """Decodes only the requested fields, each one from its slice of derData
+    found by der_index, using spec templates of specTemplates.
+    """
+    fields = frozenset(fields)
+    unknown = fields - PARSEABLE_FIELDS
+    if unknown:
+        raise ValueError("Unknown certificate fields: %s" % ", ".join(sorted(unknown)))
+    index = index_certificate(derData)
+
+    tbsFields = fields - frozenset(["signature"])
+    tbsComponentSpecs = _tbs_component_specs(specTemplates)
+    components = {}
+    for field in tbsFields:
+        name = PartialCertificate.FIELDS[field]
+        spec = tbsComponentSpecs[name]
+        raw = index.raw(name)
+        if raw is not None:
+            components[name] = decode(raw, asn1Spec=spec)[0]
+        elif name == "version":
+            components[name] = spec     # the default value
+        else:
+            components[name] = None
+    tbsCertificate = PartialCertificate(components, tbsFields, lazy_extensions)
+
+    signatureAlgorithm = None
+    if "signature_algorithm" in fields:
+        signatureAlgorithm = decode(index.raw("signatureAlgorithm"),
+                                    asn1Spec=specTemplates.get(AlgorithmIdentifier))[0]
+    signature = None
+    if "signature" in fields:
+        signature = decode(index.raw("signatureValue"),
+                           asn1Spec=specTemplates.get(ConvertibleBitString))[0]
+    x509cert = PartialX509Certificate(tbsCertificate, signatureAlgorithm, signature)
+    x509cert.set_der_data(derData, index.span("tbsCertificate"))
+    return x509cert
+
+
+templates.register(Certificate)
+
+
+# Result of one certificate of x509_parse_many. index is the position in the
+# input, exactly one of certificate (X509Certificate) and error (exception
+# raised by x509_parse) is not None.
+ParseResult = namedtuple("ParseResult", "index certificate error")
+
+
+def _parse_chunk(chunk):
+    """Worker of x509_parse_many, parses list of (index, derData).
+    Must stay at module level so that the pool can pickle it.
+    """
+    lazy_extensions, items = chunk
+    results = []
+    for index, derData in items:
+        try:
+            results.append(ParseResult(index, x509_parse(derData, lazy_extensions), None))
+        except Exception, e:
+            results.append(ParseResult(index, None, e))
+    return results
+
+
+def _make_chunks(derDatas, lazy_extensions, chunksize, chunk_bytes):
+    """Groups input into chunks of at most chunksize certificates and at most
+    chunk_bytes octets, so that a few huge certificates don't hold back a
+    worker with a long queue of others. A certificate larger than chunk_bytes
+    gets a chunk of its own.
+    """
+    items = []
+    size = 0
+    for index, derData in enumerate(derDatas):
+        derData = as_substrate(derData)
+        if items and (len(items) >= chunksize or size + len(derData) > chunk_bytes):
+            yield lazy_extensions, items
+            items = []
+            size = 0
+        items.append((index, derData))
+        size += len(derData)
+    if items:
+        yield lazy_extensions, items
+
+
+def x509_parse_many(derDatas, workers=None, chunksize=64, chunk_bytes=256*1024,
+                    ordered=True, lazy_extensions=False):
+    """Parses many certificates in a pool of worker processes.
+    @param derDatas: iterable of DER-encoded certificates, consumed lazily
+    @param workers: number of processes, defaults to number of CPUs; with
+        workers=1 everything is parsed in the calling process
+    @param chunksize: maximum number of certificates sent to a worker at once
+    @param chunk_bytes: maximum size of DER data sent to a worker at once
+    @param ordered: yield results in input order, otherwise as they complete
+    @param lazy_extensions: passed to x509_parse
+    @returns: generator of ParseResult; errors of single certificates are
+        captured in ParseResult.error instead of being raised
+    """
+    chunks = _make_chunks(derDatas, lazy_extensions, chunksize, chunk_bytes)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1:
+        for chunk in chunks:
+            for result in _parse_chunk(chunk):
+                yield result
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        if ordered:
+            mapped = pool.imap(_parse_chunk, chunks)
+        else:
+            mapped = pool.imap_unordered(_parse_chunk, chunks)
+        for results in mapped:
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        # generator closed early or parsing interrupted
+        pool.terminate()
+        pool.join()
+
+
 def print_certificate_details(x509cert):
     """
     Print certificate details